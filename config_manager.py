@@ -29,7 +29,11 @@ class ConfigManager:
                 "model": "deepseek-chat",
                 "max_tokens": 2000,
                 "temperature": 0.7,
-                "timeout": 30
+                "timeout": 30,
+                "max_retries": 3,
+                "max_concurrency": 8,
+                "rate_limit_capacity": 5,
+                "rate_limit_rate": 1.0
             },
             "tts": {
                 "engine": "edge",
@@ -7,12 +7,31 @@
 
 import json
 import logging
+import os
 from datetime import datetime
+from operator import itemgetter
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass, asdict
 from config_manager import get_config
 
+# orjson加速（可选）
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# 大文件流式解析（可选）
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+# 超过此大小的历史文件使用流式解析
+STREAM_PARSE_THRESHOLD = 5_000_000
+
 @dataclass
 class Message:
     """消息数据类"""
@@ -64,6 +83,12 @@ class Conversation:
             total_tokens=data.get("total_tokens", 0)
         )
 
+def _json_default(obj: Any) -> Any:
+    """JSON序列化钩子：直接展开消息和对话数据类，无需先转换为字典"""
+    if isinstance(obj, (Message, Conversation)):
+        return obj.__dict__
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
 class ConversationManager:
     """对话管理器"""
     
@@ -78,13 +103,22 @@ class ConversationManager:
         """加载对话历史"""
         try:
             if self.history_file.exists():
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                conversations_data = data.get("conversations", [])
-                self.conversations = [
-                    Conversation.from_dict(conv) for conv in conversations_data
-                ]
+                if IJSON_AVAILABLE and self.history_file.stat().st_size > STREAM_PARSE_THRESHOLD:
+                    # 大文件逐个对话流式解析，避免构建完整的中间字典树
+                    with open(self.history_file, 'rb') as f:
+                        self.conversations = [
+                            Conversation.from_dict(conv)
+                            for conv in ijson.items(f, 'conversations.item', use_float=True)
+                        ]
+                else:
+                    with open(self.history_file, 'rb') as f:
+                        raw = f.read()
+                    data = orjson.loads(raw) if ORJSON_AVAILABLE else json.loads(raw)
+
+                    conversations_data = data.get("conversations", [])
+                    self.conversations = [
+                        Conversation.from_dict(conv) for conv in conversations_data
+                    ]
                 
                 logging.info(f"加载了 {len(self.conversations)} 个对话")
                 return True
@@ -107,7 +141,7 @@ class ConversationManager:
             conversations_to_save = self.conversations[-max_history:]
             
             data = {
-                "conversations": [conv.to_dict() for conv in conversations_to_save],
+                "conversations": conversations_to_save,
                 "metadata": {
                     "created_at": datetime.now().isoformat(),
                     "last_updated": datetime.now().isoformat(),
@@ -116,8 +150,17 @@ class ConversationManager:
                 }
             }
             
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            # 先写临时文件再原子替换，避免写入中途崩溃损坏历史文件
+            tmp_file = self.history_file.with_suffix('.json.tmp')
+            if ORJSON_AVAILABLE:
+                payload = orjson.dumps(data, default=_json_default, option=orjson.OPT_INDENT_2)
+            else:
+                payload = json.dumps(data, indent=2, ensure_ascii=False,
+                                     default=_json_default).encode('utf-8')
+            
+            with open(tmp_file, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_file, self.history_file)
             
             logging.info(f"保存了 {len(conversations_to_save)} 个对话")
             return True
@@ -180,7 +223,8 @@ class ConversationManager:
             len([m for m in self.current_conversation.messages if m.role == "user"]) == 1):
             self.update_conversation_title(content[:30] + "..." if len(content) > 30 else content)
         
-        logging.info(f"添加消息: {role} - {content[:50]}...")
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            logging.info("添加消息: %s - %.50s...", role, content)
         return message
     
     def update_conversation_title(self, title: str) -> bool:
@@ -210,23 +254,30 @@ class ConversationManager:
     
     def get_conversation_history(self) -> List[Dict[str, Any]]:
         """获取对话历史摘要"""
-        history = []
-        for conv in self.conversations:
-            user_messages = [m for m in conv.messages if m.role == "user"]
-            assistant_messages = [m for m in conv.messages if m.role == "assistant"]
+        history = [None] * len(self.conversations)
+        for i, conv in enumerate(self.conversations):
+            user_count = 0
+            assistant_count = 0
+            for m in conv.messages:
+                if m.role == "user":
+                    user_count += 1
+                elif m.role == "assistant":
+                    assistant_count += 1
             
-            history.append({
+            history[i] = {
                 "id": conv.id,
                 "title": conv.title,
                 "created_at": conv.created_at,
                 "updated_at": conv.updated_at,
-                "message_count": len(user_messages) + len(assistant_messages),
-                "user_messages": len(user_messages),
-                "assistant_messages": len(assistant_messages),
+                "message_count": user_count + assistant_count,
+                "user_messages": user_count,
+                "assistant_messages": assistant_count,
                 "total_tokens": conv.total_tokens
-            })
+            }
         
-        return sorted(history, key=lambda x: x["updated_at"], reverse=True)
+        # updated_at为ISO-8601字符串，按字典序比较即可
+        history.sort(key=itemgetter("updated_at"), reverse=True)
+        return history
     
     def load_conversation(self, conversation_id: str) -> bool:
         """加载指定对话"""
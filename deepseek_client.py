@@ -7,14 +7,34 @@ AI客户端模块
 """
 
 import asyncio
+import atexit
+import hashlib
+import json
 import logging
+import threading
 import time
-from typing import Dict, Any, Optional, AsyncGenerator, Callable
-from openai import OpenAI
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Dict, Any, List, NamedTuple, Optional, AsyncGenerator, Awaitable, Callable, Tuple, TypeVar
+from openai import AsyncOpenAI
 import httpx
-from tenacity import retry, stop_after_attempt, wait_exponential
 from config_manager import get_config
 
+# HTTP/2支持（可选，需要安装h2）
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# orjson加速（可选）
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # 模型管理集成
 try:
     from model_manager import get_model_manager
@@ -26,7 +46,7 @@ except ImportError:
 
 # RAG系统集成
 try:
-    from rag_system import get_rag_system, enhance_ai_query, format_ai_response_with_sources
+    from rag_system import get_rag_system
     RAG_AVAILABLE = True
 except ImportError:
     RAG_AVAILABLE = False
@@ -34,7 +54,7 @@ except ImportError:
 
 # 天气查询集成
 try:
-    from weather_query_handler import get_weather_query_handler, is_weather_query, handle_weather_query
+    from weather_query_handler import get_weather_query_handler
     WEATHER_AVAILABLE = True
 except ImportError:
     WEATHER_AVAILABLE = False
@@ -42,20 +62,114 @@ except ImportError:
 
 # IP查询集成
 try:
-    from ip_query_handler import get_ip_query_handler, is_ip_query, handle_ip_query
+    from ip_query_handler import get_ip_query_handler
     IP_QUERY_AVAILABLE = True
 except ImportError:
     IP_QUERY_AVAILABLE = False
     logging.warning("IP查询功能不可用")
 
+T = TypeVar("T")
+
+# 意图识别缓存的查询最大长度，过长的查询不缓存以限制内存占用
+CLASSIFY_CACHE_MAX_QUERY_LENGTH = 512
+
+def _classify_query_uncached(query: str) -> Tuple[bool, bool]:
+    """判断查询是否为IP查询、天气查询（直接使用各处理器的识别逻辑，保证结果一致）"""
+    return (
+        IP_QUERY_AVAILABLE and get_ip_query_handler().is_ip_query(query),
+        WEATHER_AVAILABLE and get_weather_query_handler().is_weather_query(query)
+    )
+
+_classify_query_cached = lru_cache(maxsize=2048)(_classify_query_uncached)
+
+def classify_query(query: str) -> Tuple[bool, bool]:
+    """意图识别（带缓存），返回 (是否IP查询, 是否天气查询)"""
+    if not query:
+        return False, False
+
+    # 两个处理器都只对小写查询做子串匹配，规范化后结果不变
+    query_key = query.strip().lower()
+    if len(query_key) > CLASSIFY_CACHE_MAX_QUERY_LENGTH:
+        return _classify_query_uncached(query_key)
+    return _classify_query_cached(query_key)
+
+class TokenUsage(NamedTuple):
+    """Token用量"""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+
+ZERO_USAGE = TokenUsage()
+
+class ChatResult(NamedTuple):
+    """聊天完成结果
+
+    不可变，可以直接在响应缓存和合并的请求之间共享；
+    只在对外返回时通过 to_dict() 转换为字典。
+    """
+    success: bool
+    content: Optional[str] = None
+    usage: Optional[TokenUsage] = None
+    model: str = ""
+    created: int = 0
+    rag_sources: Tuple[Dict[str, Any], ...] = ()
+    error: Optional[str] = None
+    extra: Optional[Dict[str, Any]] = None  # IP/天气服务附带的数据
+    cached: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        if not self.success:
+            return {
+                "success": False,
+                "error": self.error,
+                "content": None,
+                "usage": None,
+                "rag_sources": list(self.rag_sources)
+            }
+
+        result = {
+            "success": True,
+            "content": self.content,
+            "usage": dict(self.usage._asdict()),
+            "model": self.model,
+            "created": self.created,
+            "rag_sources": list(self.rag_sources)
+        }
+        if self.extra:
+            result.update(self.extra)
+        if self.cached:
+            result["cached"] = True
+        return result
+
 class DeepSeekClient:
     """AI客户端（支持多模型提供商）"""
 
+    # 流式回调批量大小和最长间隔（秒）
+    STREAM_FLUSH_CHUNKS = 32
+    STREAM_FLUSH_INTERVAL = 0.1
+
     def __init__(self):
         self.config = get_config()
-        self.client: Optional[OpenAI] = None
-        self.last_request_time = 0
-        self.rate_limit_delay = 1.0  # 请求间隔（秒）
+        self.client: Optional[AsyncOpenAI] = None
+        self._ready = False  # 客户端已初始化且API密钥有效
+        self._http_client: Optional[httpx.AsyncClient] = None
+
+        # 令牌桶速率限制：允许突发请求，同时限制持续速率
+        api_config = self.config.get_api_config()
+        self.rate_limit_capacity = float(api_config.get("rate_limit_capacity", 5))
+        self.rate_limit_rate = float(api_config.get("rate_limit_rate", 1.0))  # 每秒补充的令牌数
+        self._tokens = self.rate_limit_capacity
+        self._last_refill = time.monotonic()
+
+        # 响应缓存（LRU + TTL），相同模型和对话直接返回，避免重复调用API
+        self.response_cache: "OrderedDict[bytes, Tuple[float, ChatResult]]" = OrderedDict()
+        self.response_cache_size = 512
+        self.response_cache_ttl = 300  # 秒
+
+        # 进行中的请求（相同请求合并为一次API调用）
+        self._inflight: Dict[bytes, "asyncio.Task[ChatResult]"] = {}
+        self._inflight_waiters: Dict[bytes, int] = {}
 
         # 初始化模型管理器和通用客户端
         if MODEL_MANAGER_AVAILABLE:
@@ -67,25 +181,65 @@ class DeepSeekClient:
             self.use_universal_client = False
             logging.info("使用传统DeepSeek客户端")
 
+        # 预先绑定查询处理器，避免每次请求经过全局便捷函数查找
+        self._rag = get_rag_system() if RAG_AVAILABLE else None
+        self._weather = get_weather_query_handler() if WEATHER_AVAILABLE else None
+        self._ip = get_ip_query_handler() if IP_QUERY_AVAILABLE else None
+
+        # 后台事件循环：所有异步请求都在此循环中执行，
+        # 保证共享的HTTP连接池始终绑定在同一个事件循环上
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(
+            target=self._loop.run_forever,
+            name="DeepSeekClientLoop",
+            daemon=True
+        )
+        self._loop_thread.start()
+
         self._initialize_client()
+        atexit.register(self.close)
     
     def _initialize_client(self) -> bool:
         """初始化OpenAI客户端"""
+        self._ready = False
         try:
             api_config = self.config.get_api_config()
+            
+            # 缓存请求参数，避免每次请求重复读取配置（update_config时刷新）
+            self._api_config = api_config
+            self._model = api_config.get("model", "deepseek-chat")
+            self._max_tokens = api_config.get("max_tokens", 2000)
+            self._temperature = api_config.get("temperature", 0.7)
+            
+            # 并发请求上限（信号量在客户端事件循环中按需创建）
+            self._max_concurrency = api_config.get("max_concurrency", 8)
+            self._semaphore = None
+            
             api_key = api_config.get("deepseek_api_key", "")
             base_url = api_config.get("base_url", "https://api.deepseek.com")
             
-            if not api_key:
+            if not api_key or not api_key.strip():
                 logging.warning("DeepSeek API密钥未配置")
                 return False
             
-            self.client = OpenAI(
+            # 共享连接池：所有请求复用keep-alive连接，HTTP/2下多个请求复用同一TCP连接
+            self._http_client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=httpx.Timeout(api_config.get("timeout", 30), connect=5.0),
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+            )
+            
+            self.client = AsyncOpenAI(
                 api_key=api_key,
                 base_url=base_url,
-                timeout=api_config.get("timeout", 30)
+                timeout=api_config.get("timeout", 30),
+                # SDK内置异步指数退避（带抖动，遵循Retry-After），
+                # 只重试连接错误、超时、429和5xx
+                max_retries=api_config.get("max_retries", 3),
+                http_client=self._http_client
             )
             
+            self._ready = True
             logging.info("DeepSeek客户端初始化成功")
             return True
             
@@ -94,47 +248,151 @@ class DeepSeekClient:
             self.client = None
             return False
     
+    async def aclose(self):
+        """关闭共享的HTTP连接池"""
+        http_client = self._http_client
+        self._http_client = None
+        self.client = None
+        self._ready = False
+        if http_client is not None:
+            await http_client.aclose()
+    
+    def close(self):
+        """同步关闭客户端（程序退出和重新配置时调用）"""
+        if self._http_client is None or not self._loop.is_running():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.aclose(), self._loop).result(timeout=5)
+        except Exception as e:
+            logging.warning(f"关闭DeepSeek客户端连接失败: {e}")
+    
     def is_configured(self) -> bool:
         """检查是否已正确配置"""
-        return self.client is not None and self.config.is_api_configured()
+        return self._ready
     
-    def _rate_limit(self):
-        """实现简单的速率限制"""
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-        
-        if time_since_last < self.rate_limit_delay:
-            sleep_time = self.rate_limit_delay - time_since_last
-            time.sleep(sleep_time)
+    def _run_sync(self, coro: Awaitable[T]) -> T:
+        """在后台事件循环中运行协程并阻塞等待结果（供同步调用方使用）"""
+        if threading.current_thread() is self._loop_thread:
+            raise RuntimeError("不能在客户端事件循环内同步等待请求")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+    
+    async def _run_on_client_loop(self, coro: Awaitable[T]) -> T:
+        """在后台事件循环中运行协程（供其他事件循环中的调用方使用）"""
+        if asyncio.get_running_loop() is self._loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+    
+    def _get_cache_key(self, messages: list, options: Optional[Dict[str, Any]] = None) -> bytes:
+        """根据当前模型、消息内容和请求参数生成缓存键"""
+        if self.use_universal_client:
+            current_model = self.model_manager.get_current_model()
+            model_key = current_model.id if current_model else ""
+        else:
+            model_key = self._model
+
+        if ORJSON_AVAILABLE:
+            payload = orjson.dumps([model_key, messages, options or {}], option=orjson.OPT_SORT_KEYS)
+        else:
+            payload = json.dumps([model_key, messages, options or {}],
+                                 ensure_ascii=False, sort_keys=True).encode('utf-8')
+
+        return hashlib.blake2b(payload, digest_size=16).digest()
+
+    def _effective_temperature(self, options: Dict[str, Any]) -> Optional[float]:
+        """请求实际使用的temperature：未显式指定时，通用客户端使用当前模型的配置，没有可用模型时返回None"""
+        if "temperature" in options:
+            return options["temperature"]
+        if self.use_universal_client:
+            current_model = self.model_manager.get_current_model()
+            return current_model.temperature if current_model else None
+        return self._temperature
+
+    def _get_cached_response(self, cache_key: bytes) -> Optional[ChatResult]:
+        """获取缓存的响应"""
+        entry = self.response_cache.get(cache_key)
+        if entry is None:
+            return None
+
+        expires_at, cached = entry
+        if time.monotonic() >= expires_at:
+            del self.response_cache[cache_key]
+            return None
+
+        self.response_cache.move_to_end(cache_key)
+        return cached._replace(cached=True)
+
+    def _cache_response(self, cache_key: bytes, result: ChatResult):
+        """缓存成功的响应"""
+        self.response_cache[cache_key] = (time.monotonic() + self.response_cache_ttl, result)
+        self.response_cache.move_to_end(cache_key)
+        while len(self.response_cache) > self.response_cache_size:
+            self.response_cache.popitem(last=False)
+
+    def clear_response_cache(self):
+        """清空响应缓存"""
+        self.response_cache.clear()
+
+    def _refill_tokens(self):
+        """按流逝时间补充令牌"""
+        now = time.monotonic()
+        self._tokens = min(
+            self.rate_limit_capacity,
+            self._tokens + (now - self._last_refill) * self.rate_limit_rate
+        )
+        self._last_refill = now
+    
+    async def _acquire(self, cost: float = 1.0):
+        """令牌桶速率限制：令牌不足时异步等待，不阻塞事件循环"""
+        self._refill_tokens()
+        while self._tokens < cost:
+            await asyncio.sleep((cost - self._tokens) / self.rate_limit_rate)
+            self._refill_tokens()
         
-        self.last_request_time = time.time()
+        self._tokens -= cost
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10)
-    )
-    def _make_request(self, messages: list, stream: bool = False, **kwargs) -> Any:
-        """发送API请求（带重试机制）"""
+    def _request_slot(self) -> asyncio.Semaphore:
+        """并发请求信号量（在客户端事件循环中按需创建）"""
         if not self.is_configured():
             raise ValueError("DeepSeek客户端未正确配置")
         
-        self._rate_limit()
-        
-        api_config = self.config.get_api_config()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self._semaphore
+    
+    async def _make_request(self, messages: list, **kwargs) -> Any:
+        """发送非流式API请求（重试由SDK的max_retries处理）"""
+        # 信号量限制同时进行的请求数，令牌桶限制请求速率
+        async with self._request_slot():
+            return await self._send_request(messages, False, **kwargs)
+    
+    @asynccontextmanager
+    async def _stream_request(self, messages: list, **kwargs):
+        """发送流式API请求，并发名额一直占用到流读完或被关闭（响应头到达时连接仍在传输）"""
+        async with self._request_slot():
+            response = await self._send_request(messages, True, **kwargs)
+            try:
+                yield response
+            finally:
+                await response.close()
+    
+    async def _send_request(self, messages: list, stream: bool, **kwargs) -> Any:
+        """按速率限制发送请求"""
+        await self._acquire()
         
         request_params = {
-            "model": api_config.get("model", "deepseek-chat"),
+            "model": self._model,
             "messages": messages,
             "stream": stream,
-            "max_tokens": api_config.get("max_tokens", 2000),
-            "temperature": api_config.get("temperature", 0.7),
+            "max_tokens": self._max_tokens,
+            "temperature": self._temperature,
             **kwargs
         }
         
-        logging.info(f"发送DeepSeek请求: {len(messages)} 条消息, stream={stream}")
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            logging.info("发送DeepSeek请求: %d 条消息, stream=%s", len(messages), stream)
         
         try:
-            response = self.client.chat.completions.create(**request_params)
+            response = await self.client.chat.completions.create(**request_params)
             logging.info("DeepSeek请求成功")
             return response
             
@@ -144,6 +402,47 @@ class DeepSeekClient:
     
     def chat_completion(self, messages: list, **kwargs) -> Dict[str, Any]:
         """同步聊天完成（支持RAG和天气查询）"""
+        return self._run_sync(self._chat_completion(messages, **kwargs)).to_dict()
+    
+    async def chat_completion_async(self, messages: list, **kwargs) -> Dict[str, Any]:
+        """异步聊天完成"""
+        result = await self._run_on_client_loop(self._chat_completion(messages, **kwargs))
+        return result.to_dict()
+    
+    async def _chat_completion(self, messages: list, **kwargs) -> ChatResult:
+        """聊天完成（在客户端事件循环中运行，合并进行中的相同请求）"""
+        request_key = self._get_cache_key(messages, kwargs)
+        
+        task = self._inflight.get(request_key)
+        if task is None:
+            # 请求作为独立任务运行，不属于任何一个调用方
+            task = self._loop.create_task(self._process_chat_completion(messages, request_key, **kwargs))
+            self._inflight[request_key] = task
+            self._inflight_waiters[request_key] = 0
+            task.add_done_callback(lambda done: self._forget_inflight(request_key, done))
+        else:
+            logging.info("合并进行中的相同请求")
+        
+        self._inflight_waiters[request_key] += 1
+        try:
+            # shield: 某个调用方被取消时不影响其他等待方；结果不可变，可直接共享
+            return await asyncio.shield(task)
+        finally:
+            if self._inflight.get(request_key) is task:
+                self._inflight_waiters[request_key] -= 1
+                if self._inflight_waiters[request_key] == 0 and not task.done():
+                    # 所有调用方都已取消，没人需要结果时才取消请求
+                    self._forget_inflight(request_key, task)
+                    task.cancel()
+    
+    def _forget_inflight(self, request_key: bytes, task: "asyncio.Task[ChatResult]"):
+        """移除进行中的请求记录（同一键可能已被新的请求占用，只移除对应的任务）"""
+        if self._inflight.get(request_key) is task:
+            del self._inflight[request_key]
+            del self._inflight_waiters[request_key]
+    
+    async def _process_chat_completion(self, messages: list, request_key: bytes, **kwargs) -> ChatResult:
+        """聊天完成实现（request_key 即 _get_cache_key(messages, kwargs)，由调用方计算一次）"""
         try:
             # 获取最后一条用户消息
             user_query = ""
@@ -152,142 +451,177 @@ class DeepSeekClient:
                 if last_message.get("role") == "user":
                     user_query = last_message.get("content", "")
 
-            # IP查询处理
-            if IP_QUERY_AVAILABLE and user_query and is_ip_query(user_query):
-                logging.info(f"检测到IP查询: {user_query}")
-                ip_result = handle_ip_query(user_query)
+            # 意图识别很廉价，同步完成后再调度耗时的查询
+            wants_ip, wants_weather = classify_query(user_query)
 
-                if ip_result["success"]:
-                    return {
-                        "success": True,
-                        "content": ip_result["response"],
-                        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
-                        "model": "ip-service",
-                        "created": int(time.time()),
-                        "ip_data": ip_result.get("ip_data"),
-                        "location_info": ip_result.get("location_info"),
-                        "weather_data": ip_result.get("weather_data"),
-                        "query_info": ip_result.get("query_type"),
-                        "rag_sources": []
-                    }
-                else:
-                    # IP查询失败，继续使用AI回答
-                    logging.warning(f"IP查询失败: {ip_result.get('error')}")
+            # 响应缓存（实际使用的temperature较高时结果不确定，不缓存）
+            cache_key = None
+            temperature = self._effective_temperature(kwargs)
+            if temperature is not None and temperature < 0.1:
+                cache_key = request_key
 
-            # 天气查询处理
-            if WEATHER_AVAILABLE and user_query and is_weather_query(user_query):
-                logging.info(f"检测到天气查询: {user_query}")
-                weather_result = handle_weather_query(user_query)
+                # IP/天气查询需要实时数据，不走缓存
+                if not (wants_ip or wants_weather):
+                    cached_result = self._get_cached_response(cache_key)
+                    if cached_result is not None:
+                        logging.info("命中响应缓存")
+                        return cached_result
 
-                if weather_result["success"]:
-                    return {
-                        "success": True,
-                        "content": weather_result["response"],
-                        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
-                        "model": "weather-service",
-                        "created": int(time.time()),
-                        "weather_data": weather_result.get("weather_data"),
-                        "query_info": weather_result.get("query_info"),
-                        "rag_sources": []
-                    }
-                else:
-                    # 天气查询失败，继续使用AI回答
-                    logging.warning(f"天气查询失败: {weather_result.get('error')}")
+            # IP查询和天气查询互不依赖，并发执行
+            service_calls = []
+            if wants_ip:
+                service_calls.append(self._maybe_ip(user_query))
+            if wants_weather:
+                service_calls.append(self._maybe_weather(user_query))
+
+            if service_calls:
+                # 按优先级（IP优先于天气）选择第一个成功的结果
+                for service_result in await asyncio.gather(*service_calls):
+                    if service_result is not None:
+                        return service_result
+
+                if cache_key is not None:
+                    cached_result = self._get_cached_response(cache_key)
+                    if cached_result is not None:
+                        logging.info("命中响应缓存")
+                        return cached_result
 
-            # RAG增强处理
-            enhanced_messages = messages.copy()
+            # RAG增强处理（确定需要调用模型后才检索：线程池中的检索无法取消，提前启动会白白占用线程）
+            # 无来源时直接使用原消息列表，不复制
+            enhanced_messages = messages
             rag_sources = []
 
-            if RAG_AVAILABLE and user_query:
-                # 使用RAG增强查询
-                enhanced_query, sources = enhance_ai_query(user_query)
+            if self._rag is not None and user_query:
+                enhanced_query, sources = await self._maybe_rag(user_query)
 
                 if sources:
-                    # 替换最后一条消息为增强后的查询
-                    enhanced_messages[-1] = {
-                        "role": "user",
-                        "content": enhanced_query
-                    }
+                    # 替换最后一条消息为增强后的查询（新列表，不修改调用方的消息）
+                    enhanced_messages = [
+                        *messages[:-1],
+                        {"role": "user", "content": enhanced_query}
+                    ]
                     rag_sources = sources
                     logging.info(f"RAG增强: 找到 {len(sources)} 个相关文档")
 
             # 使用通用客户端或传统客户端
             if self.use_universal_client:
                 # 使用通用API客户端（支持多模型）
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    api_result = loop.run_until_complete(
-                        self.universal_client.chat_completion(enhanced_messages, **kwargs)
-                    )
-                finally:
-                    loop.close()
+                api_result = await self.universal_client.chat_completion(enhanced_messages, **kwargs)
 
                 if not api_result["success"]:
-                    return {
-                        "success": False,
-                        "error": api_result["error"],
-                        "rag_sources": rag_sources
-                    }
+                    return ChatResult(
+                        success=False,
+                        error=api_result["error"],
+                        rag_sources=tuple(rag_sources)
+                    )
 
                 ai_content = api_result["content"]
                 model_name = api_result.get("model", "unknown")
-                usage = api_result.get("usage", {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
+                raw_usage = api_result.get("usage") or {}
+                usage = TokenUsage(
+                    prompt_tokens=raw_usage.get("prompt_tokens", 0),
+                    completion_tokens=raw_usage.get("completion_tokens", 0),
+                    total_tokens=raw_usage.get("total_tokens", 0)
+                )
 
             else:
                 # 使用传统DeepSeek客户端
-                response = self._make_request(enhanced_messages, stream=False, **kwargs)
+                response = await self._make_request(enhanced_messages, **kwargs)
                 ai_content = response.choices[0].message.content
                 model_name = response.model
-                usage = {
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "completion_tokens": response.usage.completion_tokens,
-                    "total_tokens": response.usage.total_tokens
-                }
+                usage = TokenUsage(
+                    prompt_tokens=response.usage.prompt_tokens,
+                    completion_tokens=response.usage.completion_tokens,
+                    total_tokens=response.usage.total_tokens
+                )
 
             # 如果使用了RAG，添加来源信息
             if rag_sources:
-                ai_content = format_ai_response_with_sources(ai_content, rag_sources)
+                ai_content = self._rag.format_response_with_sources(ai_content, rag_sources)
 
-            result = {
-                "success": True,
-                "content": ai_content,
-                "usage": usage,
-                "model": model_name,
-                "created": int(time.time()),
-                "rag_sources": rag_sources  # 添加RAG来源信息
-            }
+            result = ChatResult(
+                success=True,
+                content=ai_content,
+                usage=usage,
+                model=model_name,
+                created=int(time.time()),
+                rag_sources=tuple(rag_sources)  # 添加RAG来源信息
+            )
 
-            logging.info(f"聊天完成成功: {usage['total_tokens']} tokens, RAG来源: {len(rag_sources)}")
+            if cache_key is not None:
+                self._cache_response(cache_key, result)
+
+            logging.info(f"聊天完成成功: {usage.total_tokens} tokens, RAG来源: {len(rag_sources)}")
             return result
 
         except Exception as e:
             logging.error(f"聊天完成失败: {e}")
-            return {
-                "success": False,
-                "error": str(e),
-                "content": None,
-                "usage": None,
-                "rag_sources": []
-            }
-    
-    async def chat_completion_async(self, messages: list, **kwargs) -> Dict[str, Any]:
-        """异步聊天完成"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self.chat_completion, messages, **kwargs)
+            return ChatResult(success=False, error=str(e))
     
-    def chat_completion_stream(self, messages: list, **kwargs) -> AsyncGenerator[Dict[str, Any], None]:
-        """流式聊天完成"""
+    async def _maybe_ip(self, user_query: str) -> Optional[ChatResult]:
+        """执行IP查询，成功时返回完整的聊天结果"""
+        logging.info(f"检测到IP查询: {user_query}")
+        loop = asyncio.get_running_loop()
+        ip_result = await loop.run_in_executor(None, self._ip.handle_ip_query, user_query)
+
+        if not ip_result["success"]:
+            # IP查询失败，继续使用AI回答
+            logging.warning(f"IP查询失败: {ip_result.get('error')}")
+            return None
+
+        return ChatResult(
+            success=True,
+            content=ip_result["response"],
+            usage=ZERO_USAGE,
+            model="ip-service",
+            created=int(time.time()),
+            extra={
+                "ip_data": ip_result.get("ip_data"),
+                "location_info": ip_result.get("location_info"),
+                "weather_data": ip_result.get("weather_data"),
+                "query_info": ip_result.get("query_type")
+            }
+        )
+
+    async def _maybe_weather(self, user_query: str) -> Optional[ChatResult]:
+        """执行天气查询，成功时返回完整的聊天结果"""
+        logging.info(f"检测到天气查询: {user_query}")
+        loop = asyncio.get_running_loop()
+        weather_result = await loop.run_in_executor(None, self._weather.handle_weather_query, user_query)
+
+        if not weather_result["success"]:
+            # 天气查询失败，继续使用AI回答
+            logging.warning(f"天气查询失败: {weather_result.get('error')}")
+            return None
+
+        return ChatResult(
+            success=True,
+            content=weather_result["response"],
+            usage=ZERO_USAGE,
+            model="weather-service",
+            created=int(time.time()),
+            extra={
+                "weather_data": weather_result.get("weather_data"),
+                "query_info": weather_result.get("query_info")
+            }
+        )
+
+    async def _maybe_rag(self, user_query: str) -> Tuple[str, list]:
+        """使用RAG增强查询，返回增强后的查询和来源"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._rag.enhance_query, user_query)
+
+    async def chat_completion_stream(self, messages: list, **kwargs) -> AsyncGenerator[Dict[str, Any], None]:
+        """流式聊天完成（需在客户端事件循环中迭代）"""
         try:
-            response = self._make_request(messages, stream=True, **kwargs)
-            
-            for chunk in response:
-                if chunk.choices[0].delta.content is not None:
-                    yield {
-                        "success": True,
-                        "content": chunk.choices[0].delta.content,
-                        "finished": False
-                    }
+            async with self._stream_request(messages, **kwargs) as response:
+                async for chunk in response:
+                    if chunk.choices[0].delta.content is not None:
+                        yield {
+                            "success": True,
+                            "content": chunk.choices[0].delta.content,
+                            "finished": False
+                        }
             
             # 发送完成信号
             yield {
@@ -309,41 +643,59 @@ class DeepSeekClient:
                                          messages: list, 
                                          callback: Callable[[Dict[str, Any]], None] = None,
                                          **kwargs) -> Dict[str, Any]:
-        """异步流式聊天完成"""
+        """异步流式聊天完成
+        
+        数据块按批回调：累计 STREAM_FLUSH_CHUNKS 个增量或距上次回调超过
+        STREAM_FLUSH_INTERVAL 秒时合并为一次回调，减少逐token的字典分配和回调开销。
+        """
         try:
-            full_content = ""
+            content_parts = []
             total_chunks = 0
             
-            def stream_generator():
-                return self.chat_completion_stream(messages, **kwargs)
-            
-            # 在线程池中运行流式生成器
-            loop = asyncio.get_event_loop()
-            
             async def process_stream():
-                nonlocal full_content, total_chunks
+                nonlocal total_chunks
+                
+                pending = []
+                last_flush = time.monotonic()
                 
-                for chunk in await loop.run_in_executor(None, lambda: list(stream_generator())):
-                    if chunk["success"]:
-                        if chunk["content"]:
-                            full_content += chunk["content"]
+                try:
+                    async with self._stream_request(messages, **kwargs) as response:
+                        async for chunk in response:
+                            delta = chunk.choices[0].delta.content
+                            if not delta:
+                                continue
+                            
+                            content_parts.append(delta)
                             total_chunks += 1
-                        
-                        if callback:
-                            callback(chunk)
-                        
-                        if chunk["finished"]:
-                            break
-                    else:
-                        if callback:
-                            callback(chunk)
-                        raise Exception(chunk.get("error", "流式处理失败"))
+                            if callback is None:
+                                continue
+                            
+                            pending.append(delta)
+                            now = time.monotonic()
+                            if (len(pending) >= self.STREAM_FLUSH_CHUNKS
+                                    or now - last_flush >= self.STREAM_FLUSH_INTERVAL):
+                                callback({"success": True, "content": "".join(pending), "finished": False})
+                                pending.clear()
+                                last_flush = now
+                    
+                    if pending and callback:
+                        callback({"success": True, "content": "".join(pending), "finished": False})
+                except Exception as e:
+                    logging.error(f"流式聊天失败: {e}")
+                    if callback:
+                        callback({"success": False, "error": str(e), "content": None, "finished": True})
+                    raise
+                
+                # 发送完成信号
+                if callback:
+                    callback({"success": True, "content": "", "finished": True})
             
-            await process_stream()
+            # 流式响应必须在客户端事件循环中迭代（共享连接池绑定在该循环上）
+            await self._run_on_client_loop(process_stream())
             
             return {
                 "success": True,
-                "content": full_content,
+                "content": "".join(content_parts),
                 "chunks": total_chunks,
                 "usage": None  # 流式模式下通常不返回usage信息
             }
@@ -357,23 +709,92 @@ class DeepSeekClient:
                 "chunks": 0
             }
     
-    def test_connection(self) -> Dict[str, Any]:
-        """测试API连接"""
+    async def _list_model_ids(self) -> List[str]:
+        """获取服务端可用的模型列表"""
+        models = await self.client.models.list()
+        return [model.id for model in models.data]
+    
+    async def _test_universal_model(self) -> Dict[str, Any]:
+        """测试通用客户端当前模型的连接（优先请求模型列表，不支持时发送最小聊天请求）"""
+        model = self.model_manager.get_current_model()
+        start_time = time.monotonic()
+        model_ids = await self.universal_client.list_model_ids(model)
+        
+        if model_ids is None:
+            result = await self.model_manager.test_model_connection(model.id)
+            result["response_time"] = round(time.monotonic() - start_time, 2)
+            result["model"] = model.model_identifier
+            return result
+        
+        end_time = time.monotonic()
+        if model.model_identifier not in model_ids:
+            return {
+                "success": False,
+                "error": f"服务端不提供模型: {model.model_identifier}",
+                "response_time": round(end_time - start_time, 2)
+            }
+        
+        return {
+            "success": True,
+            "response_time": round(end_time - start_time, 2),
+            "model": model.model_identifier,
+            "provider": model.provider,
+            "tokens_used": 0,
+            "content_preview": f"模型列表获取成功，共 {len(model_ids)} 个可用模型"
+        }
+    
+    def test_connection(self, deep: bool = False) -> Dict[str, Any]:
+        """测试API连接
+        
+        默认只请求模型列表，不生成文本、不消耗token；
+        deep=True 时发送一次完整的聊天请求做端到端验证。
+        """
         try:
-            if not self.is_configured():
+            if self.use_universal_client:
+                # 请求实际由通用客户端发送，检测其当前模型而不是DeepSeek配置
+                if self.model_manager.get_current_model() is None:
+                    return {
+                        "success": False,
+                        "error": "未找到可用模型",
+                        "details": "请在模型管理中添加并选择模型"
+                    }
+                if not deep:
+                    return self._run_sync(self._test_universal_model())
+            
+            elif not self.is_configured():
                 return {
                     "success": False,
                     "error": "API未配置",
                     "details": "请检查API密钥和基础URL配置"
                 }
             
+            if not deep:
+                start_time = time.monotonic()
+                model_ids = self._run_sync(self._list_model_ids())
+                end_time = time.monotonic()
+                
+                if self._model not in model_ids:
+                    return {
+                        "success": False,
+                        "error": f"服务端不提供模型: {self._model}",
+                        "response_time": round(end_time - start_time, 2)
+                    }
+                
+                return {
+                    "success": True,
+                    "response_time": round(end_time - start_time, 2),
+                    "model": self._model,
+                    "tokens_used": 0,
+                    "content_preview": f"模型列表获取成功，共 {len(model_ids)} 个可用模型"
+                }
+            
             test_messages = [
                 {"role": "user", "content": "Hello, this is a connection test."}
             ]
             
-            start_time = time.time()
+            start_time = time.monotonic()
             result = self.chat_completion(test_messages)
-            end_time = time.time()
+            end_time = time.monotonic()
             
             if result["success"]:
                 return {
@@ -412,6 +833,7 @@ class DeepSeekClient:
     
     def update_config(self) -> bool:
         """更新配置（重新初始化客户端）"""
+        self.close()
         return self._initialize_client()
 
 # 全局DeepSeek客户端实例
@@ -8,6 +8,12 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
 import threading
+import queue
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Dict, Any
 import logging
@@ -16,6 +22,39 @@ from PIL import Image, ImageTk
 from file_manager import get_file_manager
 from clipboard_manager import get_clipboard_manager
 
+# 文件列表懒加载：每批插入的行数，以及滚动到已加载区域的多少比例时追加下一批
+ROW_BATCH_SIZE = 100
+ROW_PREFETCH_FRACTION = 0.9
+
+# 一次Tcl调用批量插入多行：rows 为 id、values 交替排列的扁平列表
+_BULK_INSERT_SCRIPT = (
+    "{w rows} {foreach {id vals} $rows "
+    "{$w insert {} end -id $id -values $vals}}"
+)
+
+REFRESH_LOADING_TEXT = "正在加载文件列表..."
+
+# 文件大小单位及对应除数
+_SIZE_UNITS = (("B", 1), ("KB", 1 << 10), ("MB", 1 << 20), ("GB", 1 << 30))
+
+# ISO时间中的日期/时间分隔符 "T" 显示为空格
+_ISO_T_TO_SPACE = str.maketrans("T", " ")
+
+# 图片预览：缩略图尺寸，以及内存中缓存的缩略图总字节上限
+PREVIEW_SIZE = (400, 400)
+PREVIEW_MEM_BUDGET = 64 * 1024 * 1024
+PREVIEW_PHOTO_CACHE_SIZE = 32
+
+# 文本预览：分块读取的大小，以及最多显示的字符数
+TEXT_PREVIEW_CHUNK = 64 * 1024
+TEXT_PREVIEW_LIMIT = 1024 * 1024
+
+# 筛选和选中事件的防抖延迟（毫秒）
+DEBOUNCE_DELAY = 150
+
+# 后台线程状态栏更新的合并间隔（毫秒）
+STATUS_FLUSH_INTERVAL = 100
+
 class FileManagementWindow:
     """文件管理窗口"""
     
@@ -25,6 +64,55 @@ class FileManagementWindow:
         self.file_manager = get_file_manager()
         self.clipboard_manager = get_clipboard_manager()
         
+        # 文件列表数据（完整列表保存在Python侧，Treeview只插入已滚动到的部分）
+        self._all_files = []
+        self._row_values = []
+        self._rows_loaded = 0
+        self._load_more_pending = False
+        self._shown_rows = {}  # Treeview中当前显示的 iid -> values
+        self._file_info_by_id = {}  # 最近一次刷新得到的 file_id -> 文件信息
+        
+        # 后台刷新线程（文件列表和存储信息的查询不占用Tk主线程）
+        self._refresh_queue = queue.Queue()
+        self._refresh_in_flight = False
+        self._refresh_pending = False
+        threading.Thread(target=self._refresh_worker, daemon=True).start()
+        
+        # 预览缩略图缓存：(file_id, mtime, size) -> (Image, 字节数)，按总字节数淘汰
+        self._thumb_mem = OrderedDict()
+        self._thumb_mem_bytes = 0
+        
+        # 最近显示过的PhotoImage：(file_id, mtime, size) -> PhotoImage
+        self._photo_cache = OrderedDict()
+        
+        # 缩略图解码线程池（PIL解码时释放GIL）；每次切换预览递增代号，丢弃过期结果
+        self._thumb_pool = ThreadPoolExecutor(max_workers=4)
+        self._preview_generation = 0
+        
+        # 防抖定时器：名称 -> after id
+        self._timers = {}
+        
+        # 上传对话框的文件类型过滤器（延迟构建）
+        self._upload_filetypes = None
+        
+        # 上传线程池：哈希、复制、缩略图和文档解析在多个文件间并行执行
+        self._upload_pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+        
+        # 共享IO线程池：上传调度、打开文件等后台任务，限制并发且避免每次新建线程
+        self._io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="fmui-io")
+        
+        # 后台线程的状态栏更新合并后最多每 STATUS_FLUSH_INTERVAL 毫秒写一次
+        self._status_lock = threading.Lock()
+        self._pending_status = None
+        self._status_scheduled = False
+        
+        # 预览区域组件（按类型创建一次，切换时隐藏/显示而不销毁重建）
+        self._current_preview = None
+        self._default_preview_label = None
+        self._error_preview_label = None
+        self._image_preview_widgets = None
+        self._doc_preview_widgets = None
+        
         # 创建窗口
         self.window = tk.Toplevel(parent) if parent else tk.Tk()
         self.window.title("📁 文件管理")
@@ -33,6 +121,7 @@ class FileManagementWindow:
         
         # 设置窗口图标和属性
         self.window.transient(parent)
+        self.window.protocol("WM_DELETE_WINDOW", self.close_window)
         if parent:
             self.window.grab_set()
         
@@ -124,7 +213,10 @@ class FileManagementWindow:
             width=10
         )
         self.filter_combo.pack(side=tk.LEFT)
-        self.filter_combo.bind("<<ComboboxSelected>>", lambda e: self.refresh_file_list())
+        self.filter_combo.bind(
+            "<<ComboboxSelected>>",
+            lambda e: self._debounce("refresh", DEBOUNCE_DELAY, self.refresh_file_list)
+        )
     
     def create_file_list(self, parent):
         """创建文件列表"""
@@ -149,12 +241,12 @@ class FileManagementWindow:
         self.file_tree.column("date", width=120)
         
         # 滚动条
-        scrollbar = ttk.Scrollbar(left_frame, orient=tk.VERTICAL, command=self.file_tree.yview)
-        self.file_tree.configure(yscrollcommand=scrollbar.set)
+        self.file_scrollbar = ttk.Scrollbar(left_frame, orient=tk.VERTICAL, command=self.file_tree.yview)
+        self.file_tree.configure(yscrollcommand=self._on_tree_yscroll)
         
         # 布局
         self.file_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.file_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         # 绑定事件
         self.file_tree.bind("<<TreeviewSelect>>", self.on_file_select)
@@ -190,8 +282,6 @@ class FileManagementWindow:
         self.storage_var = tk.StringVar()
         self.storage_label = ttk.Label(status_frame, textvariable=self.storage_var)
         self.storage_label.pack(side=tk.RIGHT)
-        
-        self.update_storage_info()
     
     def create_context_menu(self):
         """创建右键菜单"""
@@ -229,23 +319,10 @@ class FileManagementWindow:
     def upload_files(self):
         """上传文件"""
         try:
-            # 获取支持的文件类型
-            supported_formats = self.file_manager.get_supported_formats()
-            
-            # 构建文件类型过滤器
-            filetypes = [
-                ("所有支持的文件", " ".join([
-                    f"*{ext}" for ext in {**supported_formats["documents"], **supported_formats["images"]}.keys()
-                ])),
-                ("文档文件", " ".join([f"*{ext}" for ext in supported_formats["documents"].keys()])),
-                ("图片文件", " ".join([f"*{ext}" for ext in supported_formats["images"].keys()])),
-                ("所有文件", "*.*")
-            ]
-            
             # 选择文件
             file_paths = filedialog.askopenfilenames(
                 title="选择要上传的文件",
-                filetypes=filetypes
+                filetypes=self._get_upload_filetypes()
             )
             
             if file_paths:
@@ -255,28 +332,48 @@ class FileManagementWindow:
             logging.error(f"选择上传文件失败: {e}")
             messagebox.showerror("错误", f"选择文件失败: {e}")
     
+    def _get_upload_filetypes(self):
+        """文件选择对话框的类型过滤器（首次使用时构建）"""
+        if self._upload_filetypes is None:
+            # 获取支持的文件类型
+            supported_formats = self.file_manager.get_supported_formats()
+            documents = " ".join(map("*{}".format, supported_formats["documents"]))
+            images = " ".join(map("*{}".format, supported_formats["images"]))
+            
+            self._upload_filetypes = [
+                ("所有支持的文件", f"{documents} {images}"),
+                ("文档文件", documents),
+                ("图片文件", images),
+                ("所有文件", "*.*")
+            ]
+        return self._upload_filetypes
+    
     def upload_files_async(self, file_paths):
         """异步上传文件"""
         def upload_worker():
             try:
                 success_count = 0
+                done_count = 0
                 total_count = len(file_paths)
                 
-                for i, file_path in enumerate(file_paths):
-                    # 更新状态
-                    self.window.after(0, lambda: self.status_var.set(f"上传中... ({i+1}/{total_count})"))
-                    
-                    # 上传文件
-                    result = self.file_manager.upload_file(file_path)
+                # 并行上传文件，按完成顺序更新进度
+                futures = [self._upload_pool.submit(self.file_manager.upload_file, file_path)
+                           for file_path in file_paths]
+                for future in as_completed(futures):
+                    result = future.result()
+                    done_count += 1
                     
                     if result["success"]:
                         success_count += 1
                     else:
                         logging.error(f"上传文件失败: {result['error']}")
+                    
+                    # 更新状态
+                    self._post_status(f"上传中... ({done_count}/{total_count})")
                 
                 # 更新界面
                 self.window.after(0, self.refresh_file_list)
-                self.window.after(0, lambda: self.status_var.set(f"上传完成: {success_count}/{total_count} 个文件"))
+                self._post_status(f"上传完成: {success_count}/{total_count} 个文件")
 
                 # 通知主窗口更新知识库状态
                 if self.callback and success_count > 0:
@@ -291,8 +388,30 @@ class FileManagementWindow:
                 logging.error(f"异步上传文件失败: {e}")
                 self.window.after(0, lambda: messagebox.showerror("错误", f"上传失败: {e}"))
         
-        # 在新线程中执行上传
-        threading.Thread(target=upload_worker, daemon=True).start()
+        # 在共享的IO线程池中执行上传
+        self._io_pool.submit(upload_worker)
+    
+    def _post_status(self, text):
+        """从后台线程更新状态栏：只保留最新文本，合并为一次Tk更新"""
+        with self._status_lock:
+            self._pending_status = text
+            if self._status_scheduled:
+                return
+            self._status_scheduled = True
+        try:
+            self.window.after(STATUS_FLUSH_INTERVAL, self._flush_status)
+        except (RuntimeError, tk.TclError):
+            # 窗口已关闭
+            pass
+    
+    def _flush_status(self):
+        """把合并后的最新状态写入状态栏"""
+        with self._status_lock:
+            text = self._pending_status
+            self._pending_status = None
+            self._status_scheduled = False
+        if text is not None:
+            self.status_var.set(text)
     
     def paste_from_clipboard(self):
         """从剪贴板粘贴"""
@@ -338,17 +457,8 @@ class FileManagementWindow:
             )
             
             if filename:
-                # 创建临时文件
-                import tempfile
-                temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8')
-                temp_file.write(text)
-                temp_file.close()
-                
-                # 上传文件
-                result = self.file_manager.upload_file(temp_file.name, filename)
-                
-                # 删除临时文件
-                Path(temp_file.name).unlink()
+                # 直接写入存储目录，不经过临时文件
+                result = self.file_manager.upload_bytes(text.encode('utf-8'), f"{filename}.txt", filename)
                 
                 if result["success"]:
                     self.refresh_file_list()
@@ -361,63 +471,187 @@ class FileManagementWindow:
             messagebox.showerror("错误", f"创建文件失败: {e}")
     
     def refresh_file_list(self):
-        """刷新文件列表"""
+        """刷新文件列表（查询在后台线程执行，加载期间的重复请求合并为一次）"""
+        if self._refresh_in_flight:
+            self._refresh_pending = True
+            return
+        
+        self._refresh_in_flight = True
+        self.status_var.set(REFRESH_LOADING_TEXT)
+        self._refresh_queue.put(self.filter_var.get())
+    
+    def _refresh_worker(self):
+        """后台刷新线程：获取文件列表和存储信息，再交回Tk主线程应用"""
+        while True:
+            filter_type = self._refresh_queue.get()
+            if filter_type is None:
+                break
+            
+            try:
+                # 获取文件列表
+                if filter_type == "all":
+                    files = self.file_manager.get_file_list()
+                else:
+                    files = self.file_manager.get_file_list(filter_type)
+                storage_info = self.file_manager.get_storage_info()
+                payload = (files, storage_info, None)
+            except Exception as e:
+                payload = (None, None, e)
+            
+            try:
+                self.window.after(0, self._apply_refresh, *payload)
+            except (RuntimeError, tk.TclError):
+                # 窗口已关闭
+                break
+    
+    def _apply_refresh(self, files, storage_info, error):
+        """在Tk主线程中应用后台刷新结果"""
+        self._refresh_in_flight = False
+        if self._refresh_pending:
+            # 加载期间又有新的刷新请求，本次结果已过期
+            self._refresh_pending = False
+            self.refresh_file_list()
+            return
+        
         try:
-            # 清空列表
-            for item in self.file_tree.get_children():
-                self.file_tree.delete(item)
-            
-            # 获取文件列表
-            filter_type = self.filter_var.get()
-            if filter_type == "all":
-                files = self.file_manager.get_file_list()
-            else:
-                files = self.file_manager.get_file_list(filter_type)
+            if error is not None:
+                raise error
             
-            # 添加文件到列表
-            for file_info in files:
-                # 格式化文件大小
-                size = self.format_file_size(file_info["file_size"])
-                
-                # 格式化日期
-                date = file_info["upload_time"][:19].replace("T", " ")
-                
-                # 显示名称
-                display_name = file_info.get("custom_name") or file_info["original_name"]
-                
-                # 文件类型图标
-                type_icon = "📄" if file_info["file_type"] == "document" else "🖼️"
-                
-                self.file_tree.insert("", tk.END, values=(
-                    f"{type_icon} {display_name}",
-                    file_info["file_type"],
-                    size,
-                    date
-                ), tags=(file_info["id"],))
+            # 预先格式化所有行，插入时只需传入现成的元组
+            self._all_files = files
+            self._file_info_by_id = {file_info["id"]: file_info for file_info in files}
+            self._row_values = [self._format_row(file_info) for file_info in files]
+            
+            # 与当前显示的行比对后增量更新，已滚动加载的行数保持不变
+            self._reconcile_rows(max(self._rows_loaded, ROW_BATCH_SIZE))
             
             # 更新存储信息
-            self.update_storage_info()
-            self.status_var.set(f"已加载 {len(files)} 个文件")
+            self.update_storage_info(storage_info)
+            
+            # 刷新期间调用方已设置了其他状态时不覆盖
+            if self.status_var.get() == REFRESH_LOADING_TEXT:
+                self.status_var.set(f"已加载 {len(files)} 个文件")
             
         except Exception as e:
             logging.error(f"刷新文件列表失败: {e}")
             messagebox.showerror("错误", f"刷新失败: {e}")
     
-    def format_file_size(self, size_bytes):
+    def _format_row(self, file_info):
+        """格式化文件列表中的一行"""
+        return self._build_row(
+            file_info.get("custom_name"),
+            file_info["original_name"],
+            file_info["file_type"],
+            file_info["file_size"],
+            file_info["upload_time"]
+        )
+    
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _build_row(custom_name, original_name, file_type, file_size, upload_time):
+        """根据决定显示内容的字段生成行元组（结果缓存，未变化的行刷新时不再重复格式化）"""
+        # 格式化文件大小
+        size = FileManagementWindow.format_file_size(file_size)
+        
+        # 格式化日期
+        date = upload_time[:19].translate(_ISO_T_TO_SPACE)
+        
+        # 显示名称
+        display_name = custom_name or original_name
+        
+        # 文件类型图标
+        type_icon = "📄" if file_type == "document" else "🖼️"
+        
+        return (f"{type_icon} {display_name}", file_type, size, date)
+    
+    def _reconcile_rows(self, count):
+        """使Treeview与前 count 行一致，只对新增、删除、内容或顺序变化的行调用Tk"""
+        target = [
+            (file_info["id"], values)
+            for file_info, values in zip(self._all_files[:count], self._row_values[:count])
+        ]
+        target_ids = {iid for iid, _ in target}
+        
+        # 删除已不存在的行
+        stale = [iid for iid in self._shown_rows if iid not in target_ids]
+        if stale:
+            self.file_tree.delete(*stale)
+            for iid in stale:
+                del self._shown_rows[iid]
+        
+        # Treeview为空时（首次加载、切换筛选）直接整批插入
+        if not self._shown_rows:
+            self._insert_rows(target)
+            self._rows_loaded = len(target)
+            return
+        
+        # 插入新行、更新变化的行并调整顺序
+        current = list(self.file_tree.get_children())
+        for index, (iid, values) in enumerate(target):
+            shown = self._shown_rows.get(iid)
+            if shown is None:
+                self.file_tree.insert("", index, iid=iid, values=values)
+                current.insert(index, iid)
+            else:
+                if shown != values:
+                    self.file_tree.item(iid, values=values)
+                if current[index] != iid:
+                    self.file_tree.move(iid, "", index)
+                    current.remove(iid)
+                    current.insert(index, iid)
+            self._shown_rows[iid] = values
+        
+        self._rows_loaded = len(target)
+    
+    def _ensure_rows(self, hi):
+        """确保前 hi 行已插入Treeview"""
+        hi = min(hi, len(self._row_values))
+        self._insert_rows([
+            (self._all_files[index]["id"], self._row_values[index])
+            for index in range(self._rows_loaded, hi)
+        ])
+        self._rows_loaded = max(self._rows_loaded, hi)
+    
+    def _insert_rows(self, rows):
+        """在末尾批量插入行，整批只发出一次Tcl调用"""
+        if not rows:
+            return
+        flat = []
+        for iid, values in rows:
+            flat.append(iid)
+            flat.append(values)
+            self._shown_rows[iid] = values
+        self.file_tree.tk.call("apply", _BULK_INSERT_SCRIPT, self.file_tree._w, tuple(flat))
+    
+    def _load_more_rows(self):
+        """追加下一批行"""
+        self._load_more_pending = False
+        self._ensure_rows(self._rows_loaded + ROW_BATCH_SIZE)
+    
+    def _on_tree_yscroll(self, first, last):
+        """同步滚动条；可见区域接近已加载行的末尾时追加下一批"""
+        self.file_scrollbar.set(first, last)
+        if (not self._load_more_pending
+                and self._rows_loaded < len(self._row_values)
+                and float(last) >= ROW_PREFETCH_FRACTION):
+            self._load_more_pending = True
+            self.window.after_idle(self._load_more_rows)
+    
+    @staticmethod
+    def format_file_size(size_bytes):
         """格式化文件大小"""
-        if size_bytes < 1024:
+        # 由二进制位数直接确定单位：每10位进一级
+        index = min(3, max(0, (size_bytes.bit_length() - 1) // 10))
+        if index == 0:
             return f"{size_bytes} B"
-        elif size_bytes < 1024 * 1024:
-            return f"{size_bytes / 1024:.1f} KB"
-        elif size_bytes < 1024 * 1024 * 1024:
-            return f"{size_bytes / (1024 * 1024):.1f} MB"
-        else:
-            return f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"
-    
-    def update_storage_info(self):
+        name, divisor = _SIZE_UNITS[index]
+        return f"{size_bytes / divisor:.1f} {name}"
+    
+    def update_storage_info(self, storage_info=None):
         """更新存储信息"""
         try:
-            storage_info = self.file_manager.get_storage_info()
+            if storage_info is None:
+                storage_info = self.file_manager.get_storage_info()
             total_size = self.format_file_size(storage_info.get("total_size", 0))
             total_files = storage_info.get("total_files", 0)
             
@@ -431,25 +665,35 @@ class FileManagementWindow:
         try:
             selection = self.file_tree.selection()
             if selection:
-                item = selection[0]
-                file_id = self.file_tree.item(item)["tags"][0]
-                self.preview_file(file_id)
+                file_id = selection[0]
+                # 方向键连续切换时只预览最后停留的文件
+                self._debounce("preview", DEBOUNCE_DELAY, lambda: self.preview_file(file_id))
                 
         except Exception as e:
             logging.error(f"文件选择事件处理失败: {e}")
     
+    def _debounce(self, name, delay, func):
+        """防抖：delay 毫秒内重复调用时只执行最后一次"""
+        timer = self._timers.pop(name, None)
+        if timer is not None:
+            self.window.after_cancel(timer)
+        
+        def run():
+            self._timers.pop(name, None)
+            func()
+        
+        self._timers[name] = self.window.after(delay, run)
+    
     def preview_file(self, file_id):
         """预览文件"""
         try:
-            file_info = self.file_manager.get_file_info(file_id)
+            file_info = self._file_info_by_id.get(file_id) or self.file_manager.get_file_info(file_id)
             if not file_info:
                 return
             
-            # 清空预览区域
-            for widget in self.preview_frame.winfo_children():
-                widget.destroy()
+            self._preview_generation += 1
             
-            # 创建预览内容
+            # 显示预览内容
             if file_info["file_type"] == "image":
                 self.show_image_preview(file_info)
             else:
@@ -462,58 +706,157 @@ class FileManagementWindow:
     def show_image_preview(self, file_info):
         """显示图片预览"""
         try:
-            # 文件信息
-            info_frame = ttk.Frame(self.preview_frame)
-            info_frame.pack(fill=tk.X, pady=(0, 10))
-            
-            ttk.Label(info_frame, text=f"📷 {file_info['filename']}", 
-                     font=('Microsoft YaHei', 12, 'bold')).pack(anchor=tk.W)
-            ttk.Label(info_frame, text=f"大小: {self.format_file_size(file_info['file_size'])}").pack(anchor=tk.W)
+            widgets = self._ensure_image_preview_widgets()
             
-            # 图片预览
-            image_frame = ttk.Frame(self.preview_frame)
-            image_frame.pack(fill=tk.BOTH, expand=True)
+            # 文件信息
+            widgets["name"].configure(text=f"📷 {file_info['filename']}")
+            widgets["size"].configure(text=f"大小: {self.format_file_size(file_info['file_size'])}")
             
-            # 加载图片
-            image = Image.open(file_info["file_path"])
+            # 先显示占位，缩略图在后台线程中解码后再换入
+            widgets["image"].configure(image="", text="加载中…")
+            widgets["image"].image = None
+            widgets["dims"].configure(text="")
+            self._show_preview_group(widgets["group"], fill=tk.BOTH, expand=True)
             
-            # 计算缩放比例
-            max_size = (400, 400)
-            image.thumbnail(max_size, Image.Resampling.LANCZOS)
+            generation = self._preview_generation
+            file_path = Path(file_info["file_path"])
+            file_stat = file_path.stat()
+            key = (file_info["id"], file_stat.st_mtime_ns, file_stat.st_size)
             
-            # 转换为Tkinter格式
-            photo = ImageTk.PhotoImage(image)
+            # 最近看过的图片直接复用已创建的PhotoImage
+            photo = self._photo_cache.get(key)
+            if photo is not None:
+                self._photo_cache.move_to_end(key)
+                self._show_preview_photo(photo)
+                return
             
-            # 显示图片
-            image_label = ttk.Label(image_frame, image=photo)
-            image_label.image = photo  # 保持引用
-            image_label.pack(pady=10)
+            image = self._get_cached_preview_image(key)
+            if image is not None:
+                self._set_preview_image(key, image)
+                return
             
-            # 图片信息
-            ttk.Label(image_frame, text=f"尺寸: {image.size[0]} x {image.size[1]}").pack()
+            future = self._thumb_pool.submit(
+                self._decode_preview_image,
+                file_path,
+                self._preview_thumb_path(file_info["id"]),
+                file_stat.st_mtime_ns
+            )
+            future.add_done_callback(
+                lambda f: self._call_in_tk(self._on_preview_decoded, generation, key, f)
+            )
             
         except Exception as e:
             logging.error(f"显示图片预览失败: {e}")
             self.show_error_preview(f"图片预览失败: {e}")
     
+    def _preview_thumb_path(self, file_id):
+        """预览缩略图的磁盘缓存路径"""
+        return self.file_manager.thumbnails_dir / f"preview_{file_id}.png"
+    
+    def _get_cached_preview_image(self, key):
+        """从内存缓存中取预览缩略图"""
+        cached = self._thumb_mem.get(key)
+        if cached is None:
+            return None
+        self._thumb_mem.move_to_end(key)
+        return cached[0]
+    
+    def _remember_preview_image(self, key, image):
+        """写入内存缓存，超出字节上限时淘汰最久未使用的缩略图"""
+        if key in self._thumb_mem:
+            return
+        cost = image.size[0] * image.size[1] * len(image.getbands())
+        self._thumb_mem[key] = (image, cost)
+        self._thumb_mem_bytes += cost
+        while self._thumb_mem_bytes > PREVIEW_MEM_BUDGET and len(self._thumb_mem) > 1:
+            _, (_, old_cost) = self._thumb_mem.popitem(last=False)
+            self._thumb_mem_bytes -= old_cost
+    
+    @staticmethod
+    def _decode_preview_image(file_path, thumb_path, mtime_ns):
+        """读取磁盘缓存或从原图生成预览缩略图（在后台线程中执行）"""
+        try:
+            if thumb_path.stat().st_mtime_ns >= mtime_ns:
+                image = Image.open(thumb_path)
+                image.load()
+                return image
+        except OSError:
+            pass
+        
+        image = Image.open(file_path)
+        # JPEG在解码时直接按1/2、1/4、1/8缩小，避免先解码全尺寸图像
+        image.draft("RGB", (PREVIEW_SIZE[0] * 2, PREVIEW_SIZE[1] * 2))
+        image.thumbnail(PREVIEW_SIZE, Image.Resampling.LANCZOS)
+        if image.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+            image = image.convert("RGB")
+        try:
+            image.save(thumb_path, "PNG")
+        except OSError as e:
+            logging.warning(f"保存预览缩略图失败: {e}")
+        return image
+    
+    def _on_preview_decoded(self, generation, key, future):
+        """后台解码完成后在Tk主线程中换入缩略图"""
+        try:
+            image = future.result()
+        except Exception as e:
+            logging.error(f"显示图片预览失败: {e}")
+            if generation == self._preview_generation:
+                self.show_error_preview(f"图片预览失败: {e}")
+            return
+        
+        self._remember_preview_image(key, image)
+        
+        # 用户已切换到其他文件
+        if generation != self._preview_generation:
+            return
+        self._set_preview_image(key, image)
+    
+    def _set_preview_image(self, key, image):
+        """把缩略图转换为PhotoImage并显示，同时放入PhotoImage缓存"""
+        # 转换为Tkinter格式（PhotoImage必须在Tk主线程中创建）
+        photo = ImageTk.PhotoImage(image)
+        self._photo_cache[key] = photo
+        while len(self._photo_cache) > PREVIEW_PHOTO_CACHE_SIZE:
+            self._photo_cache.popitem(last=False)
+        
+        self._show_preview_photo(photo)
+    
+    def _show_preview_photo(self, photo):
+        """把PhotoImage显示到预览标签中"""
+        widgets = self._image_preview_widgets
+        widgets["image"].configure(image=photo, text="")
+        widgets["image"].image = photo  # 保持引用
+        
+        # 图片信息
+        widgets["dims"].configure(text=f"尺寸: {photo.width()} x {photo.height()}")
+    
+    def _call_in_tk(self, func, *args):
+        """从后台线程把回调交给Tk主线程执行"""
+        try:
+            self.window.after(0, func, *args)
+        except (RuntimeError, tk.TclError):
+            # 窗口已关闭
+            pass
+    
     def show_document_preview(self, file_info):
         """显示文档预览"""
         try:
-            # 文件信息
-            info_frame = ttk.Frame(self.preview_frame)
-            info_frame.pack(fill=tk.X, pady=(0, 10))
+            widgets = self._ensure_doc_preview_widgets()
             
-            ttk.Label(info_frame, text=f"📄 {file_info['filename']}", 
-                     font=('Microsoft YaHei', 12, 'bold')).pack(anchor=tk.W)
-            ttk.Label(info_frame, text=f"类型: {file_info['file_extension']}").pack(anchor=tk.W)
-            ttk.Label(info_frame, text=f"大小: {self.format_file_size(file_info['file_size'])}").pack(anchor=tk.W)
+            # 文件信息
+            widgets["name"].configure(text=f"📄 {file_info['filename']}")
+            widgets["type"].configure(text=f"类型: {file_info['file_extension']}")
+            widgets["size"].configure(text=f"大小: {self.format_file_size(file_info['file_size'])}")
+            self._show_preview_group(widgets["group"], fill=tk.BOTH, expand=True)
             
             # 文档内容预览（仅支持文本文件）
             if file_info["file_extension"].lower() in ['.txt', '.md']:
+                widgets["message"].pack_forget()
+                widgets["content"].pack(fill=tk.BOTH, expand=True, pady=(10, 0))
                 self.show_text_content(file_info)
             else:
-                ttk.Label(self.preview_frame, text="此文件类型不支持预览", 
-                         foreground="gray").pack(pady=20)
+                self._show_doc_message("此文件类型不支持预览", "gray")
                 
         except Exception as e:
             logging.error(f"显示文档预览失败: {e}")
@@ -521,63 +864,168 @@ class FileManagementWindow:
     
     def show_text_content(self, file_info):
         """显示文本内容"""
+        text_widget = self._doc_preview_widgets["text"]
         try:
-            content_frame = ttk.LabelFrame(self.preview_frame, text="文件内容", padding=5)
-            content_frame.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
-            
-            # 创建文本框
-            text_widget = tk.Text(content_frame, wrap=tk.WORD, height=15, 
-                                 font=('Consolas', 10))
-            scrollbar = ttk.Scrollbar(content_frame, orient=tk.VERTICAL, command=text_widget.yview)
-            text_widget.configure(yscrollcommand=scrollbar.set)
+            text_widget.config(state=tk.NORMAL)
+            text_widget.delete("1.0", tk.END)
             
-            # 读取文件内容
+            # 分块读取文件内容，超过上限时截断
+            total = 0
             with open(file_info["file_path"], 'r', encoding='utf-8') as f:
-                content = f.read()
-                text_widget.insert(tk.END, content)
+                while total < TEXT_PREVIEW_LIMIT:
+                    chunk = f.read(min(TEXT_PREVIEW_CHUNK, TEXT_PREVIEW_LIMIT - total))
+                    if not chunk:
+                        break
+                    text_widget.insert(tk.END, chunk)
+                    total += len(chunk)
+                else:
+                    if f.read(1):
+                        text_widget.insert(tk.END, "\n\n…（文件过大，预览内容已截断）")
             
             text_widget.config(state=tk.DISABLED)
+            text_widget.yview_moveto(0)
             
-            # 布局
+        except Exception as e:
+            logging.error(f"显示文本内容失败: {e}")
+            text_widget.delete("1.0", tk.END)
+            text_widget.config(state=tk.DISABLED)
+            self._show_doc_message(f"读取文件失败: {e}", "red")
+    
+    def _show_doc_message(self, text, color):
+        """在文档预览中用提示文字代替文件内容"""
+        widgets = self._doc_preview_widgets
+        widgets["content"].pack_forget()
+        widgets["message"].configure(text=text, foreground=color)
+        widgets["message"].pack(pady=20)
+    
+    def _ensure_image_preview_widgets(self):
+        """图片预览组件（首次使用时创建，之后复用）"""
+        if self._image_preview_widgets is None:
+            group = ttk.Frame(self.preview_frame)
+            
+            # 文件信息
+            info_frame = ttk.Frame(group)
+            info_frame.pack(fill=tk.X, pady=(0, 10))
+            name_label = ttk.Label(info_frame, font=('Microsoft YaHei', 12, 'bold'))
+            name_label.pack(anchor=tk.W)
+            size_label = ttk.Label(info_frame)
+            size_label.pack(anchor=tk.W)
+            
+            # 图片预览
+            image_frame = ttk.Frame(group)
+            image_frame.pack(fill=tk.BOTH, expand=True)
+            image_label = ttk.Label(image_frame, foreground="gray")
+            image_label.pack(pady=10)
+            dims_label = ttk.Label(image_frame)
+            dims_label.pack()
+            
+            self._image_preview_widgets = {
+                "group": group,
+                "name": name_label,
+                "size": size_label,
+                "image": image_label,
+                "dims": dims_label
+            }
+        return self._image_preview_widgets
+    
+    def _ensure_doc_preview_widgets(self):
+        """文档预览组件（首次使用时创建，之后复用）"""
+        if self._doc_preview_widgets is None:
+            group = ttk.Frame(self.preview_frame)
+            
+            # 文件信息
+            info_frame = ttk.Frame(group)
+            info_frame.pack(fill=tk.X, pady=(0, 10))
+            name_label = ttk.Label(info_frame, font=('Microsoft YaHei', 12, 'bold'))
+            name_label.pack(anchor=tk.W)
+            type_label = ttk.Label(info_frame)
+            type_label.pack(anchor=tk.W)
+            size_label = ttk.Label(info_frame)
+            size_label.pack(anchor=tk.W)
+            
+            # 提示文字（不支持预览、读取失败）
+            message_label = ttk.Label(group)
+            
+            # 文件内容
+            content_frame = ttk.LabelFrame(group, text="文件内容", padding=5)
+            text_widget = tk.Text(content_frame, wrap=tk.WORD, height=15, 
+                                 font=('Consolas', 10))
+            scrollbar = ttk.Scrollbar(content_frame, orient=tk.VERTICAL, command=text_widget.yview)
+            text_widget.configure(yscrollcommand=scrollbar.set)
             text_widget.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
             scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
             
-        except Exception as e:
-            logging.error(f"显示文本内容失败: {e}")
-            ttk.Label(self.preview_frame, text=f"读取文件失败: {e}", 
-                     foreground="red").pack(pady=20)
+            self._doc_preview_widgets = {
+                "group": group,
+                "name": name_label,
+                "type": type_label,
+                "size": size_label,
+                "message": message_label,
+                "content": content_frame,
+                "text": text_widget
+            }
+        return self._doc_preview_widgets
+    
+    def _show_preview_group(self, group, **pack_options):
+        """切换预览区域显示的组件组（其余组隐藏而不销毁）"""
+        if self._current_preview is group:
+            return
+        if self._current_preview is not None:
+            self._current_preview.pack_forget()
+        group.pack(**pack_options)
+        self._current_preview = group
     
     def show_default_preview(self):
         """显示默认预览"""
-        ttk.Label(self.preview_frame, text="请选择文件进行预览", 
-                 foreground="gray", font=('Microsoft YaHei', 12)).pack(expand=True)
+        if self._default_preview_label is None:
+            self._default_preview_label = ttk.Label(
+                self.preview_frame, text="请选择文件进行预览",
+                foreground="gray", font=('Microsoft YaHei', 12)
+            )
+        self._preview_generation += 1
+        self._show_preview_group(self._default_preview_label, expand=True)
     
     def show_error_preview(self, error_msg):
         """显示错误预览"""
-        for widget in self.preview_frame.winfo_children():
-            widget.destroy()
-        
-        ttk.Label(self.preview_frame, text=error_msg, 
-                 foreground="red", font=('Microsoft YaHei', 10)).pack(expand=True)
+        if self._error_preview_label is None:
+            self._error_preview_label = ttk.Label(
+                self.preview_frame, foreground="red", font=('Microsoft YaHei', 10)
+            )
+        self._preview_generation += 1
+        self._error_preview_label.configure(text=error_msg)
+        self._show_preview_group(self._error_preview_label, expand=True)
+    
+    def _selected_file_info(self, selection):
+        """选中文件的信息（优先使用刷新时缓存的文件信息，不再查询文件管理器）"""
+        file_id = selection[0]  # 行的iid即文件ID
+        file_info = self._file_info_by_id.get(file_id)
+        if file_info is None:
+            file_info = self.file_manager.get_file_info(file_id)
+        return file_info
     
     def on_file_double_click(self, event):
         """文件双击事件"""
         try:
             selection = self.file_tree.selection()
             if selection:
-                item = selection[0]
-                file_id = self.file_tree.item(item)["tags"][0]
-                file_info = self.file_manager.get_file_info(file_id)
+                file_info = self._selected_file_info(selection)
 
                 if file_info:
-                    # 打开文件
-                    import os
-                    os.startfile(file_info["file_path"])
+                    # 打开文件（文件关联程序可能启动较慢，在后台线程中调用）
+                    self._io_pool.submit(self._open_file_worker, file_info["file_path"])
 
         except Exception as e:
             logging.error(f"打开文件失败: {e}")
             messagebox.showerror("错误", f"打开文件失败: {e}")
 
+    def _open_file_worker(self, file_path):
+        """后台线程：用系统关联程序打开文件"""
+        try:
+            os.startfile(file_path)
+        except Exception as e:
+            logging.error(f"打开文件失败: {e}")
+            self._call_in_tk(messagebox.showerror, "错误", f"打开文件失败: {e}")
+
     def show_context_menu(self, event):
         """显示右键菜单"""
         try:
@@ -595,9 +1043,7 @@ class FileManagementWindow:
         try:
             selection = self.file_tree.selection()
             if selection:
-                item = selection[0]
-                file_id = self.file_tree.item(item)["tags"][0]
-                self.preview_file(file_id)
+                self.preview_file(selection[0])
 
         except Exception as e:
             logging.error(f"预览选中文件失败: {e}")
@@ -610,11 +1056,10 @@ class FileManagementWindow:
                 messagebox.showwarning("提示", "请先选择要重命名的文件")
                 return
 
-            item = selection[0]
-            file_id = self.file_tree.item(item)["tags"][0]
-            file_info = self.file_manager.get_file_info(file_id)
+            file_info = self._selected_file_info(selection)
 
             if file_info:
+                file_id = file_info["id"]
                 current_name = file_info.get("custom_name") or file_info["original_name"]
                 new_name = simpledialog.askstring(
                     "重命名文件",
@@ -642,11 +1087,10 @@ class FileManagementWindow:
                 messagebox.showwarning("提示", "请先选择要编辑的文件")
                 return
 
-            item = selection[0]
-            file_id = self.file_tree.item(item)["tags"][0]
-            file_info = self.file_manager.get_file_info(file_id)
+            file_info = self._selected_file_info(selection)
 
             if file_info:
+                file_id = file_info["id"]
                 current_desc = file_info.get("description", "")
 
                 # 创建描述编辑对话框
@@ -698,9 +1142,7 @@ class FileManagementWindow:
                 messagebox.showwarning("提示", "请先选择文件")
                 return
 
-            item = selection[0]
-            file_id = self.file_tree.item(item)["tags"][0]
-            file_info = self.file_manager.get_file_info(file_id)
+            file_info = self._selected_file_info(selection)
 
             if file_info:
                 self.clipboard_manager.set_text_to_clipboard(file_info["file_path"])
@@ -718,20 +1160,25 @@ class FileManagementWindow:
                 messagebox.showwarning("提示", "请先选择文件")
                 return
 
-            item = selection[0]
-            file_id = self.file_tree.item(item)["tags"][0]
-            file_info = self.file_manager.get_file_info(file_id)
+            file_info = self._selected_file_info(selection)
 
             if file_info:
-                import os
-                import subprocess
                 file_path = Path(file_info["file_path"])
 
-                # 在文件管理器中选中文件
+                # 在文件管理器中选中文件（不等待文件管理器进程结束）
                 if os.name == 'nt':  # Windows
-                    subprocess.run(['explorer', '/select,', str(file_path)])
+                    subprocess.Popen(
+                        ['explorer', f'/select,{file_path}'],
+                        creationflags=getattr(subprocess, "DETACHED_PROCESS", 0)
+                    )
                 else:  # Linux/Mac
-                    subprocess.run(['xdg-open', str(file_path.parent)])
+                    subprocess.Popen(
+                        ['xdg-open', str(file_path.parent)],
+                        start_new_session=True,
+                        stdin=subprocess.DEVNULL,
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL
+                    )
 
         except Exception as e:
             logging.error(f"打开文件位置失败: {e}")
@@ -745,11 +1192,10 @@ class FileManagementWindow:
                 messagebox.showwarning("提示", "请先选择要删除的文件")
                 return
 
-            item = selection[0]
-            file_id = self.file_tree.item(item)["tags"][0]
-            file_info = self.file_manager.get_file_info(file_id)
+            file_info = self._selected_file_info(selection)
 
             if file_info:
+                file_id = file_info["id"]
                 # 确认删除
                 result = messagebox.askyesno(
                     "确认删除",
@@ -760,6 +1206,13 @@ class FileManagementWindow:
                 if result:
                     delete_result = self.file_manager.delete_file(file_id)
                     if delete_result["success"]:
+                        self._file_info_by_id.pop(file_id, None)
+                        try:
+                            self._preview_thumb_path(file_id).unlink()
+                        except FileNotFoundError:
+                            pass
+                        for key in [key for key in self._photo_cache if key[0] == file_id]:
+                            del self._photo_cache[key]
                         self.refresh_file_list()
                         self.show_default_preview()
                         self.status_var.set(delete_result["message"])
@@ -808,6 +1261,10 @@ class FileManagementWindow:
     def close_window(self):
         """关闭窗口"""
         try:
+            self._refresh_queue.put(None)
+            self._thumb_pool.shutdown(wait=False)
+            self._upload_pool.shutdown(wait=False)
+            self._io_pool.shutdown(wait=False)
             self.window.destroy()
         except Exception as e:
             logging.error(f"关闭文件管理窗口失败: {e}")
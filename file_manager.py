@@ -6,17 +6,23 @@
 """
 
 import os
+import sys
+import errno
+import heapq
 import json
 import logging
 import shutil
-import hashlib
 import mimetypes
+import threading
+import uuid
+import atexit
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional, Any, Tuple
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from PIL import Image, ImageTk
+from PIL import ImageTk
 import io
 
 # 知识库集成
@@ -27,6 +33,121 @@ except ImportError:
     KNOWLEDGE_BASE_AVAILABLE = False
     logging.warning("知识库模块不可用")
 
+# 哈希与缩略图的纯函数放在独立模块中
+from file_workers import new_content_hasher, content_hexdigest, hash_file, render_thumbnail
+
+# orjson加速（可选）
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def _json_dumps(data: Any, indent: bool = False) -> bytes:
+    """序列化为UTF-8编码的JSON"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(data, indent=2 if indent else None, ensure_ascii=False).encode('utf-8')
+
+def _json_loads(content: bytes) -> Any:
+    """解析JSON"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(content)
+    return json.loads(content)
+
+def _upload_time_key(file_info: Dict[str, Any]) -> str:
+    """文件列表的排序键"""
+    return file_info.get("upload_time", "")
+
+def _dir_size(path: Path) -> int:
+    """统计目录（含子目录）下所有文件的总大小；scandir的目录项自带类型信息，只对文件调用stat"""
+    total = 0
+    pending = [path]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+                elif entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+    return total
+
+# reflink（写时复制克隆）的ioctl编号，仅Linux可用
+try:
+    import fcntl
+    FICLONE = 0x40049409 if sys.platform.startswith("linux") else None
+except ImportError:
+    fcntl = None
+    FICLONE = None
+
+# 普通复制时每次读写的字节数；零拷贝系统调用每次最多复制的字节数
+COPY_CHUNK_SIZE = 1 << 20
+FASTCOPY_CHUNK_SIZE = 1 << 30
+
+# 零拷贝系统调用不可用时（跨文件系统、不支持的文件系统或内核过旧）回退到普通复制
+_FASTCOPY_FALLBACK_ERRNOS = frozenset({
+    errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EBADF, errno.ENOTSUP, errno.EOPNOTSUPP, errno.ENOTTY
+})
+
+def _fastcopy(source_path: Path, target_path: Path):
+    """复制文件内容：优先reflink，其次copy_file_range、sendfile，最后用缓冲区循环复制"""
+    with open(source_path, "rb", buffering=0) as src, open(target_path, "wb") as dst:
+        src_fd, dst_fd = src.fileno(), dst.fileno()
+        
+        # 写时复制文件系统（btrfs、XFS等）上直接共享数据块，不复制任何数据
+        if FICLONE is not None:
+            try:
+                fcntl.ioctl(dst_fd, FICLONE, src_fd)
+                return
+            except OSError as e:
+                if e.errno not in _FASTCOPY_FALLBACK_ERRNOS:
+                    raise
+        
+        # 数据在内核中直接复制，不经过用户态缓冲区
+        if hasattr(os, "copy_file_range"):
+            copied = 0
+            try:
+                while True:
+                    n = os.copy_file_range(src_fd, dst_fd, FASTCOPY_CHUNK_SIZE)
+                    if not n:
+                        return
+                    copied += n
+            except OSError as e:
+                # 已经复制了部分数据时不再回退，避免目标文件内容错位
+                if copied or e.errno not in _FASTCOPY_FALLBACK_ERRNOS:
+                    raise
+        
+        # Linux上sendfile可以写入普通文件
+        if sys.platform.startswith("linux"):
+            offset = 0
+            try:
+                while True:
+                    n = os.sendfile(dst_fd, src_fd, offset, FASTCOPY_CHUNK_SIZE)
+                    if not n:
+                        return
+                    offset += n
+            except OSError as e:
+                if offset or e.errno not in _FASTCOPY_FALLBACK_ERRNOS:
+                    raise
+        
+        # 复用同一块缓冲区循环复制
+        buffer = bytearray(COPY_CHUNK_SIZE)
+        view = memoryview(buffer)
+        while True:
+            n = src.readinto(buffer)
+            if not n:
+                return
+            dst.write(view[:n])
+
+# 缩略图尺寸
+THUMBNAIL_SIZE = (150, 150)
+
+# 最后一次变更后多久（秒）把累积的变更写入日志（连续编辑合并为一次写入和fsync）
+LOG_FLUSH_DELAY = 0.5
+
+# 日志写入后多久（秒）在后台写入数据库快照
+SNAPSHOT_DELAY = 1.0
+
 class FileManager:
     """文件管理器"""
     
@@ -34,6 +155,9 @@ class FileManager:
         self.upload_dir = Path("uploads")
         self.thumbnails_dir = Path("thumbnails")
         self.files_db_path = Path("files_database.json")
+        # 变更日志：每次变更只追加一行，快照在后台合并写入
+        self.files_log_path = Path("files_database.jsonl")
+        self.files_log_old_path = Path("files_database.jsonl.old")
         
         # 支持的文件类型
         self.supported_documents = {
@@ -57,11 +181,33 @@ class FileManager:
             '.ico': 'ICO图标'
         }
         
-        # 文件数据库
+        # 支持的扩展名集合（初始化后不再变化，上传时直接查询）
+        self._image_exts = frozenset(self.supported_images)
+        self._supported_exts = frozenset(self.supported_documents) | self._image_exts
+        self._alpha_image_exts = frozenset({'.png', '.ico', '.webp', '.gif'})
+        self._mime_by_ext = {ext: mimetypes.guess_type('x' + ext)[0] for ext in self._supported_exts}
+        
+        # 文件数据库（多个上传线程并发写入时由锁保护）
         self.files_db = {}
+        self.lock = threading.RLock()
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_timer = None
+        # 尚未写入日志的变更（_dirty为True时存在）
+        self._pending_ops = []
+        self._dirty = False
+        self._save_timer: Optional[threading.Timer] = None
+        
+        # 内存索引：按类型分组的文件ID（dict作有序集合）与文件总大小，随每次变更增量维护
+        self._ids_by_type = {}
+        self._total_size = 0
+        
+        # 缩略图生成交给线程池（Pillow/pyvips处理图片时释放GIL），与哈希计算并行；
+        # 不用进程池：子进程会重新导入主程序或复制已运行的Tk和后台线程。线程按需创建
+        self._pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="fm-thumb")
         
         # 初始化
         self._initialize()
+        atexit.register(self.flush)
     
     def _initialize(self):
         """初始化文件管理器"""
@@ -79,62 +225,192 @@ class FileManager:
             logging.error(f"文件管理器初始化失败: {e}")
     
     def _load_files_database(self):
-        """加载文件数据库"""
+        """加载文件数据库（快照 + 重放变更日志）"""
         try:
             if self.files_db_path.exists():
-                with open(self.files_db_path, 'r', encoding='utf-8') as f:
-                    self.files_db = json.load(f)
+                with open(self.files_db_path, 'rb') as f:
+                    self.files_db = _json_loads(f.read())
             else:
                 self.files_db = {
                     "files": {},
                     "created_at": datetime.now().isoformat(),
                     "last_updated": datetime.now().isoformat()
                 }
+            
+            # 重放上次快照之后的变更，并立即合并为新快照
+            if self._replay_files_log() or not self.files_db_path.exists():
                 self._save_files_database()
         except Exception as e:
             logging.error(f"加载文件数据库失败: {e}")
             self.files_db = {"files": {}}
+        
+        self._rebuild_index()
+    
+    def _rebuild_index(self):
+        """根据文件数据库重建内存索引"""
+        self._ids_by_type = {}
+        self._total_size = 0
+        for file_id, file_info in self.files_db.get("files", {}).items():
+            self._index_add(file_id, file_info)
+    
+    def _index_add(self, file_id: str, file_info: Dict[str, Any]):
+        """把文件加入内存索引（调用方持有锁）"""
+        self._ids_by_type.setdefault(file_info.get("file_type"), {})[file_id] = None
+        self._total_size += file_info.get("file_size", 0)
+    
+    def _index_remove(self, file_id: str, file_info: Dict[str, Any]):
+        """把文件移出内存索引（调用方持有锁）"""
+        ids = self._ids_by_type.get(file_info.get("file_type"))
+        if ids is not None:
+            ids.pop(file_id, None)
+        self._total_size -= file_info.get("file_size", 0)
+    
+    def _replay_files_log(self) -> int:
+        """把变更日志应用到已加载的快照上，返回重放的变更数"""
+        files = self.files_db.setdefault("files", {})
+        replayed = 0
+        for log_path in (self.files_log_old_path, self.files_log_path):
+            if not log_path.exists():
+                continue
+            with open(log_path, 'rb') as f:
+                for line in f:
+                    try:
+                        op = _json_loads(line)
+                    except ValueError:
+                        # 写入中途崩溃留下的不完整行
+                        logging.warning(f"跳过损坏的数据库日志行: {log_path}")
+                        continue
+                    self._apply_log_op(files, op)
+                    replayed += 1
+        if replayed:
+            logging.info(f"已重放 {replayed} 条文件数据库变更")
+        return replayed
+    
+    @staticmethod
+    def _apply_log_op(files: Dict[str, Any], op: Dict[str, Any]):
+        """应用一条变更（变更记录的都是最终值，重复应用结果不变）"""
+        kind = op.get("op")
+        if kind == "add":
+            files[op["id"]] = op["info"]
+        elif kind == "del":
+            files.pop(op["id"], None)
+        elif kind == "update":
+            file_info = files.get(op["id"])
+            if file_info is not None:
+                file_info.update(op["fields"])
+    
+    def _log_changes(self, *ops: Dict[str, Any]):
+        """记录变更（内存中的数据库已更新），稍后合并写入日志"""
+        with self.lock:
+            self._pending_ops.extend(ops)
+            self._dirty = True
+            self._schedule_save()
+    
+    def _schedule_save(self):
+        """防抖：连续变更只在最后一次之后写一次日志（调用方持有锁）"""
+        if self._save_timer is not None:
+            self._save_timer.cancel()
+        self._save_timer = threading.Timer(LOG_FLUSH_DELAY, self._flush_changes)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+    
+    def _flush_changes(self, schedule_snapshot: bool = True):
+        """把累积的变更追加写入日志并同步到磁盘，随后安排后台快照"""
+        try:
+            with self.lock:
+                if not self._dirty:
+                    return
+                data = b"".join(_json_dumps(op) + b"\n" for op in self._pending_ops)
+                with open(self.files_log_path, 'ab') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._pending_ops = []
+                self._dirty = False
+                
+                # 防抖：连续写入只在最后一次之后写一次快照
+                if not schedule_snapshot:
+                    return
+                if self._snapshot_timer is not None:
+                    self._snapshot_timer.cancel()
+                self._snapshot_timer = threading.Timer(SNAPSHOT_DELAY, self._save_files_database)
+                self._snapshot_timer.daemon = True
+                self._snapshot_timer.start()
+        except Exception as e:
+            logging.error(f"写入文件数据库日志失败: {e}")
+    
+    def flush(self):
+        """立即写入所有未保存的变更并合并为快照（退出前调用）"""
+        with self.lock:
+            for timer in (self._save_timer, self._snapshot_timer):
+                if timer is not None:
+                    timer.cancel()
+            self._save_timer = None
+            self._snapshot_timer = None
+        self._flush_changes(schedule_snapshot=False)
+        self._save_files_database()
     
     def _save_files_database(self):
-        """保存文件数据库"""
+        """保存文件数据库快照，并清除已包含在快照中的变更日志"""
         try:
-            self.files_db["last_updated"] = datetime.now().isoformat()
-            with open(self.files_db_path, 'w', encoding='utf-8') as f:
-                json.dump(self.files_db, f, indent=2, ensure_ascii=False)
+            with self._snapshot_lock:
+                with self.lock:
+                    self.files_db["last_updated"] = datetime.now().isoformat()
+                    payload = _json_dumps(self.files_db, indent=True)
+                    
+                    # 轮换日志：之后的变更写入新日志，不会在清除时丢失
+                    if self.files_log_path.exists():
+                        if self.files_log_old_path.exists():
+                            with open(self.files_log_old_path, 'ab') as old:
+                                old.write(self.files_log_path.read_bytes())
+                            self.files_log_path.unlink()
+                        else:
+                            os.replace(self.files_log_path, self.files_log_old_path)
+                
+                temp_path = self.files_db_path.with_name(self.files_db_path.name + ".tmp")
+                with open(temp_path, 'wb') as f:
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.files_db_path)
+                
+                if self.files_log_old_path.exists():
+                    self.files_log_old_path.unlink()
         except Exception as e:
             logging.error(f"保存文件数据库失败: {e}")
     
-    def _calculate_file_hash(self, file_path: Path) -> str:
-        """计算文件哈希值"""
+    def _submit_to_pool(self, func, *args) -> Optional[Future]:
+        """提交到线程池，线程池已关闭（解释器退出中）时返回None"""
         try:
-            hash_md5 = hashlib.md5()
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_md5.update(chunk)
-            return hash_md5.hexdigest()
-        except Exception as e:
-            logging.error(f"计算文件哈希失败: {e}")
-            return ""
+            return self._pool.submit(func, *args)
+        except RuntimeError as e:
+            logging.warning(f"线程池不可用，改为在当前线程执行: {e}")
+            return None
+    
+    @staticmethod
+    def _pool_result(future: Optional[Future], func, *args):
+        """等待线程池结果；未能提交时在当前线程执行"""
+        if future is not None:
+            return future.result()
+        return func(*args)
+    
+    def _run_in_pool(self, func, *args):
+        """在线程池中执行并等待结果"""
+        return self._pool_result(self._submit_to_pool(func, *args), func, *args)
     
-    def _generate_thumbnail(self, image_path: Path, size: Tuple[int, int] = (150, 150)) -> Optional[Path]:
-        """生成图片缩略图"""
+    def _thumbnail_suffix(self, file_ext: str) -> str:
+        """缩略图格式：可能带透明通道的格式用PNG，其余用JPEG（编码更快、体积更小）"""
+        return ".png" if file_ext.lower() in self._alpha_image_exts else ".jpg"
+    
+    def _thumbnail_path(self, image_path: Path) -> Path:
+        """缩略图保存路径"""
+        return self.thumbnails_dir / f"thumb_{image_path.stem}{self._thumbnail_suffix(image_path.suffix)}"
+    
+    def _generate_thumbnail(self, image_path: Path, size: Tuple[int, int] = THUMBNAIL_SIZE) -> Optional[Path]:
+        """生成图片缩略图（在线程池中执行）"""
         try:
-            thumbnail_path = self.thumbnails_dir / f"thumb_{image_path.stem}.png"
-            
-            with Image.open(image_path) as img:
-                # 转换为RGB模式（处理RGBA等格式）
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                    img = background
-                
-                # 生成缩略图
-                img.thumbnail(size, Image.Resampling.LANCZOS)
-                img.save(thumbnail_path, "PNG")
-                
-                return thumbnail_path
+            result = self._run_in_pool(render_thumbnail, str(image_path), str(self._thumbnail_path(image_path)), size)
+            return Path(result) if result else None
         except Exception as e:
             logging.error(f"生成缩略图失败: {e}")
             return None
@@ -149,104 +425,198 @@ class FileManager:
             
             # 检查文件类型
             file_ext = source_path.suffix.lower()
-            if file_ext not in {**self.supported_documents, **self.supported_images}:
+            if file_ext not in self._supported_exts:
+                return {"success": False, "error": f"不支持的文件类型: {file_ext}"}
+            
+            # 先复制到临时文件（同一文件系统上优先reflink），哈希和缩略图都从副本计算
+            token = uuid.uuid4().hex
+            temp_path = self.upload_dir / f".upload_{token}.part"
+            temp_thumb = None
+            thumb_future = None
+            thumbnail_path = None
+            try:
+                _fastcopy(source_path, temp_path)
+                # 保留权限和时间戳（与copy2一致）
+                shutil.copystat(source_path, temp_path)
+                
+                # 缩略图在线程池中生成，同时在当前线程计算哈希
+                if file_ext in self._image_exts:
+                    temp_thumb = self.thumbnails_dir / f".upload_{token}{self._thumbnail_suffix(file_ext)}"
+                    thumb_args = (str(temp_path), str(temp_thumb), THUMBNAIL_SIZE)
+                    thumb_future = self._submit_to_pool(render_thumbnail, *thumb_args)
+                file_hash = hash_file(str(temp_path))
+                
+                # 生成文件ID和目标路径
+                file_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file_hash[:8]}"
+                
+                # 使用自定义名称或原始名称
+                if custom_name:
+                    filename = f"{custom_name}{file_ext}"
+                else:
+                    filename = source_path.name
+                
+                target_path = self.upload_dir / f"{file_id}_{filename}"
+                
+                # 缩略图读取的是临时文件，需等它完成后再移动
+                if temp_thumb is not None:
+                    future, thumb_future = thumb_future, None
+                    try:
+                        rendered = self._pool_result(future, render_thumbnail, *thumb_args)
+                    except Exception as e:
+                        logging.error(f"生成缩略图失败: {e}")
+                        rendered = None
+                    if rendered:
+                        thumbnail_path = self._thumbnail_path(target_path)
+                        os.replace(temp_thumb, thumbnail_path)
+                
+                os.replace(temp_path, target_path)
+            except BaseException:
+                if thumb_future is not None and not thumb_future.cancel():
+                    # 等缩略图任务结束后再清理它的输出
+                    wait([thumb_future])
+                for path in (temp_path, temp_thumb):
+                    if path is not None and path.exists():
+                        path.unlink()
+                raise
+            
+            return self._register_uploaded_file(
+                target_path, file_id, file_hash, thumbnail_path,
+                source_path.name, custom_name, filename, file_ext
+            )
+            
+        except Exception as e:
+            logging.error(f"文件上传失败: {e}")
+            return {"success": False, "error": f"上传失败: {e}"}
+    
+    def upload_bytes(self, data: bytes, file_name: str, custom_name: str = None) -> Dict[str, Any]:
+        """上传内存中的数据（如剪贴板文本），直接写入存储目录，不经过临时文件"""
+        try:
+            # 检查文件类型
+            file_ext = Path(file_name).suffix.lower()
+            if file_ext not in self._supported_exts:
                 return {"success": False, "error": f"不支持的文件类型: {file_ext}"}
             
             # 生成文件ID和目标路径
-            file_hash = self._calculate_file_hash(source_path)
+            hasher = new_content_hasher()
+            hasher.update(data)
+            file_hash = content_hexdigest(hasher)
             file_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file_hash[:8]}"
             
             # 使用自定义名称或原始名称
             if custom_name:
                 filename = f"{custom_name}{file_ext}"
             else:
-                filename = source_path.name
+                filename = file_name
             
             target_path = self.upload_dir / f"{file_id}_{filename}"
             
-            # 复制文件
-            shutil.copy2(source_path, target_path)
-            
-            # 确定文件类型
-            is_image = file_ext in self.supported_images
-            file_type = "image" if is_image else "document"
+            # 写入文件
+            with open(target_path, 'wb') as f:
+                f.write(data)
             
             # 生成缩略图（如果是图片）
             thumbnail_path = None
-            if is_image:
+            if file_ext in self._image_exts:
                 thumbnail_path = self._generate_thumbnail(target_path)
             
-            # 获取文件信息
-            file_stat = target_path.stat()
-            
-            # 保存到数据库
-            file_info = {
-                "id": file_id,
-                "original_name": source_path.name,
-                "custom_name": custom_name,
-                "filename": filename,
-                "file_path": str(target_path),
-                "file_type": file_type,
-                "file_extension": file_ext,
-                "file_size": file_stat.st_size,
-                "file_hash": file_hash,
-                "thumbnail_path": str(thumbnail_path) if thumbnail_path else None,
-                "mime_type": mimetypes.guess_type(str(target_path))[0],
-                "upload_time": datetime.now().isoformat(),
-                "description": ""
-            }
+            return self._register_uploaded_file(
+                target_path, file_id, file_hash, thumbnail_path,
+                file_name, custom_name, filename, file_ext
+            )
             
+        except Exception as e:
+            logging.error(f"文件上传失败: {e}")
+            return {"success": False, "error": f"上传失败: {e}"}
+    
+    def _register_uploaded_file(self, target_path: Path, file_id: str, file_hash: str,
+                                thumbnail_path: Optional[Path], original_name: str,
+                                custom_name: Optional[str], filename: str,
+                                file_ext: str) -> Dict[str, Any]:
+        """登记已写入存储目录的文件：写入数据库并添加到知识库"""
+        # 确定文件类型
+        file_type = "image" if file_ext in self._image_exts else "document"
+        
+        # 获取文件信息
+        file_stat = target_path.stat()
+        
+        # 保存到数据库
+        file_info = {
+            "id": file_id,
+            "original_name": original_name,
+            "custom_name": custom_name,
+            "filename": filename,
+            "file_path": str(target_path),
+            "file_type": file_type,
+            "file_extension": file_ext,
+            "file_size": file_stat.st_size,
+            "file_hash": file_hash,
+            "thumbnail_path": str(thumbnail_path) if thumbnail_path else None,
+            "mime_type": self._mime_by_ext.get(file_ext),
+            "upload_time": datetime.now().isoformat(),
+            "description": ""
+        }
+        
+        with self.lock:
+            previous = self.files_db["files"].get(file_id)
+            if previous is not None:
+                self._index_remove(file_id, previous)
             self.files_db["files"][file_id] = file_info
-            self._save_files_database()
+            self._index_add(file_id, file_info)
+            self._log_changes({"op": "add", "id": file_id, "info": file_info})
 
-            # 添加到知识库（如果是文档类型）
-            knowledge_base_result = None
-            if KNOWLEDGE_BASE_AVAILABLE and file_type == "document":
-                try:
-                    kb = get_knowledge_base()
-                    kb_result = kb.add_document(
-                        file_id=file_id,
-                        file_name=filename,
-                        file_path=str(target_path),
-                        tags=[],
-                        category=""
-                    )
-                    knowledge_base_result = kb_result
-                    if kb_result["success"]:
-                        logging.info(f"文档已添加到知识库: {filename}")
-                    else:
-                        logging.warning(f"添加到知识库失败: {kb_result.get('error', '未知错误')}")
-                except Exception as e:
-                    logging.error(f"知识库集成失败: {e}")
+        # 添加到知识库（如果是文档类型）
+        knowledge_base_result = None
+        if KNOWLEDGE_BASE_AVAILABLE and file_type == "document":
+            try:
+                kb = get_knowledge_base()
+                kb_result = kb.add_document(
+                    file_id=file_id,
+                    file_name=filename,
+                    file_path=str(target_path),
+                    tags=[],
+                    category=""
+                )
+                knowledge_base_result = kb_result
+                if kb_result["success"]:
+                    logging.info(f"文档已添加到知识库: {filename}")
+                else:
+                    logging.warning(f"添加到知识库失败: {kb_result.get('error', '未知错误')}")
+            except Exception as e:
+                logging.error(f"知识库集成失败: {e}")
 
-            logging.info(f"文件上传成功: {filename}")
+        logging.info(f"文件上传成功: {filename}")
 
-            result = {
-                "success": True,
-                "file_info": file_info,
-                "message": f"文件 '{filename}' 上传成功"
-            }
+        result = {
+            "success": True,
+            "file_info": file_info,
+            "message": f"文件 '{filename}' 上传成功"
+        }
 
-            # 添加知识库信息
-            if knowledge_base_result:
-                result["knowledge_base"] = knowledge_base_result
+        # 添加知识库信息
+        if knowledge_base_result:
+            result["knowledge_base"] = knowledge_base_result
+
+        return result
 
-            return result
-            
-        except Exception as e:
-            logging.error(f"文件上传失败: {e}")
-            return {"success": False, "error": f"上传失败: {e}"}
     
-    def get_file_list(self, file_type: str = None) -> List[Dict[str, Any]]:
-        """获取文件列表"""
+    def get_file_list(self, file_type: str = None, limit: int = None) -> List[Dict[str, Any]]:
+        """获取文件列表（按上传时间倒序），limit指定时只返回最新的limit个"""
         try:
-            files = list(self.files_db.get("files", {}).values())
-            
-            if file_type:
-                files = [f for f in files if f.get("file_type") == file_type]
+            with self.lock:
+                files_by_id = self.files_db.get("files", {})
+                if file_type:
+                    # 只取该类型的文件，不必扫描全部文件
+                    files = (files_by_id[file_id] for file_id in self._ids_by_type.get(file_type, ()))
+                else:
+                    files = files_by_id.values()
+                
+                # 只需要最新的几个时用堆做部分选择，不对全部文件排序
+                if limit is not None:
+                    return heapq.nlargest(limit, files, key=_upload_time_key)
+                files = list(files)
             
             # 按上传时间排序
-            files.sort(key=lambda x: x.get("upload_time", ""), reverse=True)
+            files.sort(key=_upload_time_key, reverse=True)
             
             return files
             
@@ -277,8 +647,10 @@ class FileManager:
                     thumbnail_path.unlink()
             
             # 从数据库删除
-            del self.files_db["files"][file_id]
-            self._save_files_database()
+            with self.lock:
+                if self.files_db["files"].pop(file_id, None) is not None:
+                    self._index_remove(file_id, file_info)
+                self._log_changes({"op": "del", "id": file_id})
 
             # 从知识库删除（如果是文档类型）
             if KNOWLEDGE_BASE_AVAILABLE and file_info.get("file_type") == "document":
@@ -318,7 +690,11 @@ class FileManager:
             file_ext = file_info["file_extension"]
             file_info["filename"] = f"{new_name}{file_ext}"
             
-            self._save_files_database()
+            self._log_changes({
+                "op": "update",
+                "id": file_id,
+                "fields": {"custom_name": new_name, "filename": file_info["filename"]}
+            })
             
             logging.info(f"文件重命名成功: {old_name} -> {new_name}")
             
@@ -339,7 +715,7 @@ class FileManager:
                 return {"success": False, "error": "文件不存在"}
             
             file_info["description"] = description
-            self._save_files_database()
+            self._log_changes({"op": "update", "id": file_id, "fields": {"description": description}})
             
             return {"success": True, "message": "文件描述更新成功"}
             
@@ -357,15 +733,13 @@ class FileManager:
     def get_storage_info(self) -> Dict[str, Any]:
         """获取存储信息"""
         try:
-            total_files = len(self.files_db.get("files", {}))
-            total_size = 0
-            
-            for file_info in self.files_db.get("files", {}).values():
-                total_size += file_info.get("file_size", 0)
+            with self.lock:
+                total_files = len(self.files_db.get("files", {}))
+                total_size = self._total_size
             
             # 计算目录大小
-            upload_dir_size = sum(f.stat().st_size for f in self.upload_dir.rglob('*') if f.is_file())
-            thumbnails_dir_size = sum(f.stat().st_size for f in self.thumbnails_dir.rglob('*') if f.is_file())
+            upload_dir_size = _dir_size(self.upload_dir)
+            thumbnails_dir_size = _dir_size(self.thumbnails_dir)
             
             return {
                 "total_files": total_files,
@@ -384,24 +758,32 @@ class FileManager:
         """清理孤立文件"""
         try:
             cleaned_files = []
-            
-            # 检查数据库中的文件是否存在
-            for file_id, file_info in list(self.files_db.get("files", {}).items()):
-                file_path = Path(file_info["file_path"])
-                if not file_path.exists():
-                    del self.files_db["files"][file_id]
-                    cleaned_files.append(file_info["filename"])
-            
-            # 检查目录中的孤立文件
-            db_files = {Path(info["file_path"]).name for info in self.files_db.get("files", {}).values()}
-            
-            for file_path in self.upload_dir.iterdir():
-                if file_path.is_file() and file_path.name not in db_files:
-                    file_path.unlink()
-                    cleaned_files.append(file_path.name)
-            
-            if cleaned_files:
-                self._save_files_database()
+            removed_ids = []
+            
+            with self.lock:
+                # 检查数据库中的文件是否存在，同时收集仍在使用的文件名和缩略图名
+                db_files = set()
+                db_thumbs = set()
+                for file_id, file_info in list(self.files_db.get("files", {}).items()):
+                    file_path = Path(file_info["file_path"])
+                    if not file_path.exists():
+                        del self.files_db["files"][file_id]
+                        self._index_remove(file_id, file_info)
+                        removed_ids.append(file_id)
+                        cleaned_files.append(file_info["filename"])
+                        continue
+                    db_files.add(file_path.name)
+                    if file_info.get("thumbnail_path"):
+                        db_thumbs.add(Path(file_info["thumbnail_path"]).name)
+                    # 文件管理界面的预览图缓存
+                    db_thumbs.add(f"preview_{file_id}.png")
+            
+                # 检查目录中的孤立文件和缩略图
+                cleaned_files.extend(self._remove_orphans(self.upload_dir, db_files))
+                cleaned_files.extend(self._remove_orphans(self.thumbnails_dir, db_thumbs))
+            
+                if removed_ids:
+                    self._log_changes(*({"op": "del", "id": file_id} for file_id in removed_ids))
             
             return {
                 "success": True,
@@ -413,6 +795,18 @@ class FileManager:
             logging.error(f"清理孤立文件失败: {e}")
             return {"success": False, "error": f"清理失败: {e}"}
 
+    @staticmethod
+    def _remove_orphans(directory: Path, keep: set) -> List[str]:
+        """删除目录中不在keep里的文件（跳过正在上传的临时文件），返回删除的文件名"""
+        with os.scandir(directory) as entries:
+            orphans = [entry for entry in entries
+                       if entry.name not in keep
+                       and not entry.name.startswith(".upload_")
+                       and entry.is_file(follow_symlinks=False)]
+        for entry in orphans:
+            os.unlink(entry.path)
+        return [entry.name for entry in orphans]
+
 # 全局文件管理器实例
 file_manager = FileManager()
 
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件处理工作函数
+供文件管理器调用的纯函数：计算内容哈希、生成缩略图（缩略图在线程池中执行）。
+本模块不依赖文件管理器的全局实例。
+"""
+
+import hashlib
+import logging
+from typing import Optional, Tuple
+
+from PIL import Image
+
+# BLAKE3哈希加速（可选，多线程SIMD）
+try:
+    import blake3
+    BLAKE3_AVAILABLE = True
+except ImportError:
+    BLAKE3_AVAILABLE = False
+
+# libvips缩略图加速（可选，缺少libvips动态库时导入会抛OSError）
+try:
+    import pyvips
+    PYVIPS_AVAILABLE = True
+except (ImportError, OSError):
+    PYVIPS_AVAILABLE = False
+
+# 计算文件哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1 << 20
+
+# 内容哈希摘要的字节数（BLAKE3和blake2b输出相同长度，文件标识不随安装的可选包变化）
+CONTENT_DIGEST_SIZE = 16
+
+# JPEG缩略图质量
+THUMBNAIL_JPEG_QUALITY = 85
+
+
+def new_content_hasher():
+    """创建内容哈希对象（仅用作文件标识，不需要密码学强度）：优先BLAKE3，否则blake2b"""
+    if BLAKE3_AVAILABLE:
+        return blake3.blake3(max_threads=blake3.blake3.AUTO)
+    return hashlib.blake2b(digest_size=CONTENT_DIGEST_SIZE)
+
+
+def content_hexdigest(hasher) -> str:
+    """取内容哈希的十六进制摘要（BLAKE3截取为CONTENT_DIGEST_SIZE字节）"""
+    if BLAKE3_AVAILABLE:
+        return hasher.hexdigest(length=CONTENT_DIGEST_SIZE)
+    return hasher.hexdigest()
+
+
+def hash_file(file_path: str) -> str:
+    """计算文件哈希值"""
+    hasher = new_content_hasher()
+    if hasattr(hasher, "update_mmap"):
+        # 内存映射整个文件，由blake3多线程并行计算（较早的blake3版本没有该方法，走下面的分块读取）
+        hasher.update_mmap(file_path)
+        return content_hexdigest(hasher)
+
+    # 复用同一块缓冲区读取，避免每次读取都分配新的bytes对象
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(file_path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            hasher.update(view[:n])
+    return content_hexdigest(hasher)
+
+
+def render_thumbnail(image_path: str, thumbnail_path: str, size: Tuple[int, int]) -> Optional[str]:
+    """生成缩略图（按thumbnail_path的扩展名输出JPEG或PNG），成功返回缩略图路径"""
+    if PYVIPS_AVAILABLE:
+        try:
+            return _render_thumbnail_vips(image_path, thumbnail_path, size)
+        except Exception as e:
+            logging.warning(f"libvips生成缩略图失败，改用Pillow: {e}")
+    as_jpeg = thumbnail_path.lower().endswith(".jpg")
+    try:
+        with Image.open(image_path) as img:
+            # JPEG按目标尺寸在DCT阶段缩小解码（1/2、1/4、1/8），其他格式不受影响
+            img.draft('RGB', size)
+
+            if img.mode in ('LA', 'P'):
+                img = img.convert('RGBA')
+
+            # 生成缩略图（150像素下BICUBIC与LANCZOS肉眼无差别，速度约快一倍）
+            img.thumbnail(size, Image.Resampling.BICUBIC)
+
+            # 缩小后再铺白色背景，alpha_composite在C中一次完成，且只处理缩略图大小的像素
+            if img.mode == 'RGBA':
+                background = Image.new('RGBA', img.size, (255, 255, 255, 255))
+                img = Image.alpha_composite(background, img).convert('RGB')
+            if as_jpeg:
+                if img.mode not in ('RGB', 'L'):
+                    img = img.convert('RGB')
+                img.save(thumbnail_path, "JPEG", quality=THUMBNAIL_JPEG_QUALITY)
+            else:
+                img.save(thumbnail_path, "PNG")
+
+            return thumbnail_path
+    except Exception as e:
+        logging.error(f"生成缩略图失败: {e}")
+        return None
+
+
+def _render_thumbnail_vips(image_path: str, thumbnail_path: str, size: Tuple[int, int]) -> str:
+    """使用libvips生成缩略图（解码时即缩小，流式处理，内存占用低）"""
+    img = pyvips.Image.thumbnail(image_path, size[0], height=size[1], size="down")
+    # 透明背景铺白，与Pillow路径保持一致
+    if img.hasalpha():
+        img = img.flatten(background=[255])
+    if thumbnail_path.lower().endswith(".jpg"):
+        img.jpegsave(thumbnail_path, Q=THUMBNAIL_JPEG_QUALITY)
+    else:
+        img.write_to_file(thumbnail_path)
+    return thumbnail_path
@@ -6,14 +6,82 @@ IP地址查询和地理位置服务模块
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import logging
-from typing import Dict, Any, Optional
-import re
+import time
+from functools import lru_cache
+from typing import Dict, Any, Optional, List
+import ipaddress
+import socket
+
+# DNS查询（可选，用于Team Cymru的ASN查询）
+try:
+    import dns.exception
+    import dns.resolver
+    DNSPYTHON_AVAILABLE = True
+    _DNS_ERRORS = (dns.exception.DNSException,)
+except ImportError:
+    DNSPYTHON_AVAILABLE = False
+    _DNS_ERRORS = ()
+
+# IP信息缓存时长（秒）：地理位置信息通常数小时内不变
+IP_INFO_CACHE_TTL = 3600
+
+# ip-api.com返回的字段（默认不含大洲、UTC偏移和货币）
+IP_API_COM_FIELDS = (
+    "status,message,query,continentCode,country,countryCode,region,regionName,"
+    "city,zip,lat,lon,timezone,offset,currency,org,as"
+)
+
+# ip-api.com批量接口每次请求的最大IP数
+IP_API_COM_BATCH_SIZE = 100
+
+# Team Cymru的IP到ASN映射DNS区域（TXT记录：ASN | 网段 | 国家代码 | 注册机构 | 分配日期）
+CYMRU_ORIGIN_ZONES = {4: "origin.asn.cymru.com", 6: "origin6.asn.cymru.com"}
+CYMRU_ASN_ZONE = "asn.cymru.com"
+
+class _IPAPIError(Exception):
+    """IP数据源返回的错误（不写入缓存）"""
+
+def _ip_version(ip_address: str) -> str:
+    """IP版本（与ipapi.co的version字段格式一致）"""
+    return "IPv6" if ":" in ip_address else "IPv4"
+
+def _format_utc_offset(seconds: int) -> str:
+    """把秒数格式化为+0800形式的UTC偏移"""
+    sign = "-" if seconds < 0 else "+"
+    minutes = abs(seconds) // 60
+    return f"{sign}{minutes // 60:02d}{minutes % 60:02d}"
 
 class IPLocationService:
     """IP地址和地理位置查询服务"""
     
+    # 可用的IP数据源（ipapi.co为主数据源）
+    PROVIDERS = ("ipapi.co", "ip-api.com", "ipinfo.io")
+    
+    # 返回字段映射：(返回字段名, ipapi.co字段名, 默认值)，ip字段单独处理
+    _FIELD_MAP = (
+        ("version", "version", "未知"),
+        ("city", "city", "未知"),
+        ("region", "region", "未知"),
+        ("region_code", "region_code", ""),
+        ("country", "country_name", "未知"),
+        ("country_code", "country_code", ""),
+        ("continent", "continent_code", ""),
+        ("postal", "postal", ""),
+        ("latitude", "latitude", 0),
+        ("longitude", "longitude", 0),
+        ("timezone", "timezone", "未知"),
+        ("utc_offset", "utc_offset", ""),
+        ("country_calling_code", "country_calling_code", ""),
+        ("currency", "currency", ""),
+        ("currency_name", "currency_name", ""),
+        ("languages", "languages", ""),
+        ("asn", "asn", ""),
+        ("org", "org", ""),
+    )
+    
     def __init__(self):
         # ipapi.co API配置
         self.ipapi_base_url = "https://ipapi.co"
@@ -26,49 +94,31 @@ class IPLocationService:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         
+        # 复用keep-alive连接，避免每次查询重新进行TCP和TLS握手
+        self._session = requests.Session()
+        self._session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        
+        # IP信息缓存（LRU，按时间段过期）
+        self._fetch_ip_data_cached = lru_cache(maxsize=256)(self._fetch_ip_data)
+        
         logging.info("IP地址查询服务初始化完成")
     
     def get_current_ip_info(self) -> Dict[str, Any]:
         """获取当前IP地址的完整信息"""
         try:
-            url = f"{self.ipapi_base_url}/json/"
-            
-            response = requests.get(url, headers=self.headers, timeout=self.timeout)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            # 检查是否有错误
-            if "error" in data:
+            try:
+                data = self._get_ip_data(None)
+            except _IPAPIError as e:
                 return {
                     "success": False,
-                    "error": data.get("reason", "未知错误")
+                    "error": str(e)
                 }
             
             # 解析IP信息
-            ip_info = {
-                "success": True,
-                "ip": data.get("ip", "未知"),
-                "version": data.get("version", "未知"),
-                "city": data.get("city", "未知"),
-                "region": data.get("region", "未知"),
-                "region_code": data.get("region_code", ""),
-                "country": data.get("country_name", "未知"),
-                "country_code": data.get("country_code", ""),
-                "continent": data.get("continent_code", ""),
-                "postal": data.get("postal", ""),
-                "latitude": data.get("latitude", 0),
-                "longitude": data.get("longitude", 0),
-                "timezone": data.get("timezone", "未知"),
-                "utc_offset": data.get("utc_offset", ""),
-                "country_calling_code": data.get("country_calling_code", ""),
-                "currency": data.get("currency", ""),
-                "currency_name": data.get("currency_name", ""),
-                "languages": data.get("languages", ""),
-                "asn": data.get("asn", ""),
-                "org": data.get("org", ""),
-                "data_source": "ipapi.co"
-            }
+            ip_info = self._shape_ip_info(data, "未知")
             
             logging.info(f"获取IP信息成功: {ip_info['ip']}")
             return ip_info
@@ -96,44 +146,16 @@ class IPLocationService:
                     "error": "无效的IP地址格式"
                 }
             
-            url = f"{self.ipapi_base_url}/{ip_address}/json/"
-            
-            response = requests.get(url, headers=self.headers, timeout=self.timeout)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            # 检查是否有错误
-            if "error" in data:
+            try:
+                data = self._get_ip_data(ip_address)
+            except _IPAPIError as e:
                 return {
                     "success": False,
-                    "error": data.get("reason", "未知错误")
+                    "error": str(e)
                 }
             
             # 解析IP信息
-            ip_info = {
-                "success": True,
-                "ip": data.get("ip", ip_address),
-                "version": data.get("version", "未知"),
-                "city": data.get("city", "未知"),
-                "region": data.get("region", "未知"),
-                "region_code": data.get("region_code", ""),
-                "country": data.get("country_name", "未知"),
-                "country_code": data.get("country_code", ""),
-                "continent": data.get("continent_code", ""),
-                "postal": data.get("postal", ""),
-                "latitude": data.get("latitude", 0),
-                "longitude": data.get("longitude", 0),
-                "timezone": data.get("timezone", "未知"),
-                "utc_offset": data.get("utc_offset", ""),
-                "country_calling_code": data.get("country_calling_code", ""),
-                "currency": data.get("currency", ""),
-                "currency_name": data.get("currency_name", ""),
-                "languages": data.get("languages", ""),
-                "asn": data.get("asn", ""),
-                "org": data.get("org", ""),
-                "data_source": "ipapi.co"
-            }
+            ip_info = self._shape_ip_info(data, ip_address)
             
             logging.info(f"获取IP信息成功: {ip_address}")
             return ip_info
@@ -151,6 +173,257 @@ class IPLocationService:
                 "error": f"数据解析失败: {str(e)}"
             }
     
+    def _fetch_ip_data(self, ip_address: Optional[str], bucket: int) -> Dict[str, Any]:
+        """请求ipapi.co获取IP信息（ip_address为None时查询当前IP），bucket只用于让缓存按时间段过期"""
+        if ip_address:
+            url = f"{self.ipapi_base_url}/{ip_address}/json/"
+        else:
+            url = f"{self.ipapi_base_url}/json/"
+        
+        response = self._session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        
+        data = response.json()
+        
+        # 检查是否有错误（抛出异常，错误结果不会被缓存）
+        if "error" in data:
+            raise _IPAPIError(data.get("reason", "未知错误"))
+        return data
+    
+    def _get_ip_data(self, ip_address: Optional[str]) -> Dict[str, Any]:
+        """获取IP信息（命中缓存时不发起网络请求）"""
+        if ip_address is None:
+            # 当前IP随网络切换而变化，不按小时缓存（由调用方按需做短时缓存）
+            return self._fetch_ip_data(None, 0)
+        return self._fetch_ip_data_cached(ip_address, int(time.time() // IP_INFO_CACHE_TTL))
+    
+    def clear_cache(self):
+        """清空IP信息缓存"""
+        self._fetch_ip_data_cached.cache_clear()
+    
+    def _shape_ip_info(self, data: Dict[str, Any], default_ip: str,
+                       data_source: str = "ipapi.co") -> Dict[str, Any]:
+        """把ipapi.co格式的响应整理为统一的IP信息结构"""
+        ip_info = {"success": True, "ip": data.get("ip", default_ip)}
+        ip_info.update((key, data.get(source, default)) for key, source, default in self._FIELD_MAP)
+        ip_info["data_source"] = data_source
+        return ip_info
+    
+    def get_ip_info_from(self, provider: str, ip_address: Optional[str] = None) -> Dict[str, Any]:
+        """从指定数据源获取IP信息（ip_address为None时查询当前IP）"""
+        if provider == "ipapi.co":
+            return self.get_ip_info(ip_address) if ip_address else self.get_current_ip_info()
+        
+        try:
+            if ip_address and not self._is_valid_ip(ip_address):
+                return {
+                    "success": False,
+                    "error": "无效的IP地址格式"
+                }
+            
+            if provider == "ip-api.com":
+                data = self._fetch_ip_api_com(ip_address)
+            elif provider == "ipinfo.io":
+                data = self._fetch_ipinfo(ip_address)
+            elif provider == "team-cymru":
+                data = self._dns_asn_lookup(ip_address)
+            else:
+                return {
+                    "success": False,
+                    "error": f"不支持的数据源: {provider}"
+                }
+            
+            return self._shape_ip_info(data, ip_address or "未知", provider)
+            
+        except _IPAPIError as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+        except requests.exceptions.RequestException as e:
+            logging.error(f"从{provider}获取IP信息失败: {e}")
+            return {
+                "success": False,
+                "error": f"网络请求失败: {str(e)}"
+            }
+        except _DNS_ERRORS as e:
+            logging.error(f"从{provider}获取IP信息失败: {e}")
+            return {
+                "success": False,
+                "error": f"DNS查询失败: {str(e)}"
+            }
+        except Exception as e:
+            logging.error(f"解析{provider}的IP信息失败: {e}")
+            return {
+                "success": False,
+                "error": f"数据解析失败: {str(e)}"
+            }
+    
+    def _fetch_ip_api_com(self, ip_address: Optional[str]) -> Dict[str, Any]:
+        """请求ip-api.com（免费接口仅支持HTTP），转换为ipapi.co的字段格式"""
+        url = f"http://ip-api.com/json/{ip_address or ''}"
+        response = self._session.get(url, params={"fields": IP_API_COM_FIELDS}, timeout=self.timeout)
+        response.raise_for_status()
+        
+        return self._map_ip_api_com(response.json(), ip_address)
+    
+    @staticmethod
+    def _map_ip_api_com(data: Dict[str, Any], ip_address: Optional[str]) -> Dict[str, Any]:
+        """把ip-api.com的单条结果转换为ipapi.co的字段格式"""
+        if data.get("status") != "success":
+            raise _IPAPIError(data.get("message", "未知错误"))
+        
+        ip = data.get("query") or ip_address or ""
+        asn, _, org = (data.get("as") or "").partition(" ")
+        offset = data.get("offset")
+        mapped = {
+            "ip": ip,
+            "version": _ip_version(ip),
+            "city": data.get("city"),
+            "region": data.get("regionName"),
+            "region_code": data.get("region"),
+            "country_name": data.get("country"),
+            "country_code": data.get("countryCode"),
+            "continent_code": data.get("continentCode"),
+            "postal": data.get("zip"),
+            "latitude": data.get("lat"),
+            "longitude": data.get("lon"),
+            "timezone": data.get("timezone"),
+            "utc_offset": _format_utc_offset(offset) if isinstance(offset, int) else None,
+            "currency": data.get("currency"),
+            "asn": asn,
+            "org": data.get("org") or org,
+        }
+        # 缺失的字段交给_shape_ip_info填默认值
+        return {key: value for key, value in mapped.items() if value not in (None, "")}
+    
+    def get_ip_info_batch(self, ip_addresses: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取多个IP地址的信息（ip-api.com批量接口，每次请求最多100个），返回 IP -> IP信息"""
+        results = {}
+        valid_ips = []
+        for ip_address in dict.fromkeys(ip_addresses):
+            if self._is_valid_ip(ip_address):
+                valid_ips.append(ip_address)
+            else:
+                results[ip_address] = {
+                    "success": False,
+                    "error": "无效的IP地址格式"
+                }
+        
+        for start in range(0, len(valid_ips), IP_API_COM_BATCH_SIZE):
+            chunk = valid_ips[start:start + IP_API_COM_BATCH_SIZE]
+            try:
+                response = self._session.post(
+                    "http://ip-api.com/batch",
+                    params={"fields": IP_API_COM_FIELDS},
+                    json=chunk,
+                    timeout=self.timeout
+                )
+                response.raise_for_status()
+                items = response.json()
+            except requests.exceptions.RequestException as e:
+                logging.error(f"批量获取IP信息失败: {e}")
+                items = None
+                error = f"网络请求失败: {str(e)}"
+            except ValueError as e:
+                logging.error(f"解析批量IP信息失败: {e}")
+                items = None
+                error = f"数据解析失败: {str(e)}"
+            
+            if items is None:
+                results.update((ip_address, {"success": False, "error": error}) for ip_address in chunk)
+                continue
+            
+            # 批量接口按请求顺序返回结果
+            for ip_address, data in zip(chunk, items):
+                try:
+                    mapped = self._map_ip_api_com(data, ip_address)
+                    results[ip_address] = self._shape_ip_info(mapped, ip_address, "ip-api.com")
+                except _IPAPIError as e:
+                    results[ip_address] = {
+                        "success": False,
+                        "error": str(e)
+                    }
+        
+        logging.info(f"批量获取IP信息完成: {len(results)} 个地址")
+        return results
+    
+    def _fetch_ipinfo(self, ip_address: Optional[str]) -> Dict[str, Any]:
+        """请求ipinfo.io，转换为ipapi.co的字段格式"""
+        url = f"https://ipinfo.io/{ip_address}/json" if ip_address else "https://ipinfo.io/json"
+        response = self._session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        
+        data = response.json()
+        if "error" in data:
+            error = data["error"]
+            raise _IPAPIError(error.get("message", "未知错误") if isinstance(error, dict) else str(error))
+        if data.get("bogon"):
+            raise _IPAPIError("保留地址，没有地理位置信息")
+        
+        ip = data.get("ip") or ip_address or ""
+        asn, _, org = (data.get("org") or "").partition(" ")
+        latitude, _, longitude = (data.get("loc") or "").partition(",")
+        mapped = {
+            "ip": ip,
+            "version": _ip_version(ip),
+            "city": data.get("city"),
+            "region": data.get("region"),
+            # ipinfo.io只提供国家代码
+            "country_name": data.get("country"),
+            "country_code": data.get("country"),
+            "postal": data.get("postal"),
+            "latitude": float(latitude) if latitude else None,
+            "longitude": float(longitude) if longitude else None,
+            "timezone": data.get("timezone"),
+            "asn": asn if asn.startswith("AS") else None,
+            "org": org if asn.startswith("AS") else data.get("org"),
+        }
+        # 缺失的字段交给_shape_ip_info填默认值
+        return {key: value for key, value in mapped.items() if value not in (None, "")}
+    
+    def _query_txt(self, name: str) -> List[str]:
+        """查询DNS TXT记录"""
+        answer = dns.resolver.resolve(name, "TXT", lifetime=self.timeout)
+        return [b"".join(record.strings).decode("utf-8", "replace") for record in answer]
+    
+    def _dns_asn_lookup(self, ip_address: Optional[str]) -> Dict[str, Any]:
+        """通过Team Cymru的DNS TXT记录查询IP所属ASN和国家（只有ASN级信息，没有城市），转换为ipapi.co的字段格式"""
+        if not DNSPYTHON_AVAILABLE:
+            raise _IPAPIError("DNS查询不可用（未安装dnspython）")
+        if not ip_address:
+            raise _IPAPIError("DNS查询需要指定IP地址")
+        
+        ip = ipaddress.ip_address(ip_address)
+        # reverse_pointer形如 8.8.8.8.in-addr.arpa / 1.0...8.b.d.0.1.0.0.2.ip6.arpa，去掉后两级即为反转的地址
+        reversed_ip = ip.reverse_pointer.rsplit(".", 2)[0]
+        records = self._query_txt(f"{reversed_ip}.{CYMRU_ORIGIN_ZONES[ip.version]}")
+        if not records:
+            raise _IPAPIError("未找到ASN记录")
+        
+        # 同一网段可能由多个ASN宣告，取第一个
+        fields = [field.strip() for field in records[0].split("|")]
+        asn = fields[0].split()[0] if fields[0] else ""
+        country_code = fields[2] if len(fields) > 2 else ""
+        
+        org = ""
+        if asn:
+            # AS名称记录：ASN | 国家代码 | 注册机构 | 分配日期 | AS名称
+            try:
+                name_fields = self._query_txt(f"AS{asn}.{CYMRU_ASN_ZONE}")[0].split("|")
+                org = name_fields[4].strip() if len(name_fields) > 4 else ""
+            except _DNS_ERRORS + (IndexError,):
+                pass
+        
+        mapped = {
+            "ip": ip_address,
+            "version": _ip_version(ip_address),
+            "country_code": country_code,
+            "asn": f"AS{asn}" if asn else "",
+            "org": org,
+        }
+        return {key: value for key, value in mapped.items() if value}
+    
     def get_ip_field(self, ip_address: str, field: str) -> Dict[str, Any]:
         """获取IP地址的特定字段信息"""
         try:
@@ -177,7 +450,7 @@ class IPLocationService:
             
             url = f"{self.ipapi_base_url}/{ip_address}/{field}/"
             
-            response = requests.get(url, headers=self.headers, timeout=self.timeout)
+            response = self._session.get(url, timeout=self.timeout)
             response.raise_for_status()
             
             # 获取字段值
@@ -246,26 +519,18 @@ class IPLocationService:
             }
     
     def _is_valid_ip(self, ip_address: str) -> bool:
-        """验证IP地址格式"""
+        """验证IP地址格式（IPv4/IPv6）"""
+        # IPv4快速路径：inet_pton在C层一次扫描完成严格的点分十进制校验
         try:
-            # IPv4格式验证
-            ipv4_pattern = r'^(\d{1,3}\.){3}\d{1,3}$'
-            if re.match(ipv4_pattern, ip_address):
-                parts = ip_address.split('.')
-                return all(0 <= int(part) <= 255 for part in parts)
-            
-            # IPv6格式验证（简单验证）
-            ipv6_pattern = r'^([0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4}$'
-            if re.match(ipv6_pattern, ip_address):
-                return True
-            
-            # 压缩IPv6格式
-            if '::' in ip_address:
-                return True
-            
-            return False
-            
-        except Exception:
+            socket.inet_pton(socket.AF_INET, ip_address)
+            return True
+        except (OSError, ValueError):
+            pass
+        
+        try:
+            ipaddress.IPv6Address(ip_address)
+            return True
+        except ValueError:
             return False
     
     def format_ip_info_response(self, ip_info: Dict[str, Any]) -> str:
@@ -6,8 +6,31 @@ IP查询处理模块
 """
 
 import re
+import sys
 import logging
-from typing import Dict, Any, Optional, Tuple, List
+import ipaddress
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Dict, Any, Optional, Tuple, List, Callable, Set
+
+logger = logging.getLogger(__name__)
+
+# Aho-Corasick多关键词匹配（可选）
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# RE2正则引擎（可选，线性时间匹配，不会因回溯退化）
+try:
+    import re2
+    RE2_AVAILABLE = True
+except ImportError:
+    RE2_AVAILABLE = False
 
 # IP服务导入
 try:
@@ -15,7 +38,7 @@ try:
     IP_SERVICE_AVAILABLE = True
 except ImportError:
     IP_SERVICE_AVAILABLE = False
-    logging.warning("IP查询服务不可用")
+    logger.warning("IP查询服务不可用")
 
 # 天气服务导入（用于基于IP的天气查询）
 try:
@@ -23,77 +46,247 @@ try:
     WEATHER_SERVICE_AVAILABLE = True
 except ImportError:
     WEATHER_SERVICE_AVAILABLE = False
-    logging.warning("天气服务不可用")
+    logger.warning("天气服务不可用")
+
+# IP地址正则表达式，导入时编译一次。IP地址只含ASCII字符，用ASCII模式匹配：
+# \d只匹配0-9，\b把中文字符当作非单词字符（"IP是8.8.8.8吗"也能匹配）
+_IPV4_PATTERN = r'\b(?:\d{1,3}\.){3}\d{1,3}\b'
+_IPV6_PATTERN = (
+    r'\b(?:[0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4}\b'  # IPv6完整格式
+    r'|\b[0-9a-fA-F:]+::[0-9a-fA-F:]*\b'  # IPv6压缩格式
+)
+if RE2_AVAILABLE:
+    # RE2的\d和\b本身只认ASCII，语义与re.ASCII一致
+    _IPV4_RE = re2.compile(_IPV4_PATTERN)
+    _IPV6_RE = re2.compile(_IPV6_PATTERN)
+else:
+    _IPV4_RE = re.compile(_IPV4_PATTERN, re.ASCII)
+    _IPV6_RE = re.compile(_IPV6_PATTERN, re.ASCII)
+
+
+def _search_ip(query: str):
+    """查找第一个IP地址：IPv4必含'.'、IPv6必含':'，先用C层的子串查找排除不可能的情况，再运行正则"""
+    if "." in query:
+        match = _IPV4_RE.search(query)
+        if match:
+            return match
+    if ":" in query:
+        return _IPV6_RE.search(query)
+    return None
+
+
+@lru_cache(maxsize=256)
+def _canon_ip(ip_address: str) -> Optional[str]:
+    """校验并规范化IP地址（同一地址的不同写法得到同一结果），无效地址（如999.999.999.999）返回None"""
+    try:
+        return ipaddress.ip_address(ip_address).compressed
+    except ValueError:
+        return None
+
+
+# IP查询相关关键词
+IP_KEYWORDS = {
+    "current_ip": (
+        "我的IP", "当前IP", "本机IP", "IP地址", "公网IP", "外网IP", "我的ip",
+        "查询IP", "查看IP", "获取IP", "显示IP", "IP是什么", "IP是多少",
+        "my ip", "current ip", "ip address", "public ip", "external ip",
+        "what is my ip", "show my ip", "get my ip", "check ip"
+    ),
+    "ip_location": (
+        "IP位置", "IP地理位置", "IP归属地", "IP所在地", "IP定位", "查询IP位置",
+        "ip location", "ip geolocation", "where is ip", "ip address location",
+        "locate ip", "find ip location", "ip info", "ip information"
+    ),
+    "ip_weather": (
+        "我这里的天气", "本地天气", "当前位置天气", "我所在地天气", "这里天气",
+        "local weather", "weather here", "my location weather", "current location weather"
+    )
+}
+
+# 小写关键词（去重并驻留），导入时计算一次
+_KW_BY_CAT_LOWER = {
+    category: frozenset(sys.intern(keyword.lower()) for keyword in keywords)
+    for category, keywords in IP_KEYWORDS.items()
+}
+_ALL_KEYWORDS_LOWER = frozenset().union(*_KW_BY_CAT_LOWER.values())
+
+# 关键词的公共子串：每个关键词都至少包含其中一个，查询一个都不含时不可能命中关键词。
+# 以后新增的关键词如果不含这些子串，会把自身加入进来，保证预筛不漏判
+_KEYWORD_ANCHORS = ("ip", "天气", "weather")
+_KEYWORD_ANCHORS += tuple(sorted(
+    keyword for keyword in _ALL_KEYWORDS_LOWER
+    if not any(anchor in keyword for anchor in _KEYWORD_ANCHORS)
+))
+
+# 同时命中多个类别时的优先级：IP天气 > IP位置 > 当前IP
+QUERY_TYPE_PRIORITY = ("ip_weather", "ip_location", "current_ip")
+
+
+def _build_keyword_matcher() -> Callable[[str], Set[str]]:
+    """构建关键词匹配器，返回 小写文本 -> 命中的关键词类别集合 的函数"""
+    if AHOCORASICK_AVAILABLE:
+        automaton = ahocorasick.Automaton()
+        for category, keywords in _KW_BY_CAT_LOWER.items():
+            for keyword in keywords:
+                automaton.add_word(keyword, automaton.get(keyword, frozenset()) | {category})
+        automaton.make_automaton()
+        
+        def matched_categories(text: str) -> Set[str]:
+            return {category for _, categories in automaton.iter(text) for category in categories}
+        
+        return matched_categories
+    
+    if RE2_AVAILABLE:
+        # RE2模式集合：一次扫描返回所有命中的关键词编号
+        keyword_set = re2.Set.SearchSet()
+        keyword_categories = []
+        for category, keywords in _KW_BY_CAT_LOWER.items():
+            for keyword in keywords:
+                keyword_set.Add(re2.escape(keyword))
+                keyword_categories.append(category)
+        keyword_set.Compile()
+        
+        def matched_categories(text: str) -> Set[str]:
+            return {keyword_categories[index] for index in keyword_set.Match(text) or ()}
+        
+        return matched_categories
+    
+    # 未安装pyahocorasick和RE2时退化为每个类别一个预编译的正则
+    category_patterns = {
+        category: re.compile("|".join(re.escape(keyword) for keyword in sorted(keywords)))
+        for category, keywords in _KW_BY_CAT_LOWER.items()
+    }
+    
+    def matched_categories(text: str) -> Set[str]:
+        return {category for category, pattern in category_patterns.items() if pattern.search(text)}
+    
+    return matched_categories
+
+
+def _matched_categories(query_lower: str) -> Set[str]:
+    """返回小写查询命中的关键词类别集合"""
+    return _keyword_matcher()(query_lower)
+
+
+# 关键词匹配器：第一次有查询通过预筛时才构建，之后线程间共享
+_keyword_matcher = lru_cache(maxsize=None)(_build_keyword_matcher)
+
+
+def _may_contain_keyword(query_lower: str) -> bool:
+    """预筛：绝大多数非IP查询在这里即被排除，不进入关键词匹配和分类缓存"""
+    # 几次C层子串查找（锚点本身就是关键词子串，再按二元字符组筛选不会多排除任何查询）
+    return any(anchor in query_lower for anchor in _KEYWORD_ANCHORS)
+
+
+def _pick_query_type(categories: Set[str], ip_address: Optional[str]) -> str:
+    """根据命中的关键词类别和提取到的IP地址确定查询类型"""
+    # 按优先级选取命中的关键词类别
+    for query_type in QUERY_TYPE_PRIORITY:
+        if query_type in categories:
+            return query_type
+    
+    # 如果包含IP地址，默认为IP位置查询
+    if ip_address:
+        return "ip_location"
+    
+    # 默认为当前IP查询
+    return "current_ip"
+
+
+# 分类结果缓存（助手中相同的查询经常重复出现）
+@lru_cache(maxsize=512)
+def _classify(query_lower: str) -> Tuple[bool, Optional[str], Optional[str]]:
+    """分类小写查询（关键词和IP地址各扫描一次），返回 (是否IP查询, 查询类型, IP地址)"""
+    # 检查是否包含IP相关关键词
+    categories = _matched_categories(query_lower)
+    if not categories:
+        return False, None, None
+    
+    # 提取IP地址（如果有），确定查询类型
+    match = _search_ip(query_lower)
+    ip_address = match.group(0) if match else None
+    return True, _pick_query_type(categories, ip_address), ip_address
+
+
+def _classify_query(query: str) -> Tuple[bool, Optional[str], Optional[str]]:
+    """分类原始查询：先预筛，只有可能是IP查询的才进入关键词匹配和分类缓存"""
+    if not query:
+        return False, None, None
+    query_lower = query.lower()
+    if not _may_contain_keyword(query_lower):
+        return False, None, None
+    return _classify(query_lower)
+
 
 class IPQueryHandler:
     """IP查询处理器"""
     
+    QUERY_TYPE_PRIORITY = QUERY_TYPE_PRIORITY
+    
+    # IP查询相关关键词（模块级常量，实例间共享）
+    ip_keywords = IP_KEYWORDS
+    
+    # 分类用的匹配器等都在模块级共享，实例只保存服务句柄、线程池和IP信息缓存
+    __slots__ = (
+        "_ip_service", "_weather_service", "_lookup_pool_instance", "_lazy_init_lock",
+        "_ip_cache", "_ip_cache_size", "_ip_cache_ttl", "_current_ip_cache_ttl", "_ip_cache_lock",
+    )
+    
     def __init__(self):
-        self.ip_service = None
-        self.weather_service = None
+        # 服务和查询线程池在第一次IP查询时才创建，非IP查询不承担初始化开销
+        self._ip_service = None
+        self._weather_service = None
+        self._lookup_pool_instance = None
+        self._lazy_init_lock = threading.Lock()
         
-        if IP_SERVICE_AVAILABLE:
-            self.ip_service = get_ip_location_service()
+        # IP信息缓存（LRU + TTL）：键为规范化的IP地址，当前IP用None作键
+        self._ip_cache: "OrderedDict[Optional[str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._ip_cache_size = 1024
+        self._ip_cache_ttl = 3600  # 秒
+        self._current_ip_cache_ttl = 300  # 秒（本机IP可能随网络切换而变化）
+        self._ip_cache_lock = threading.Lock()
         
-        if WEATHER_SERVICE_AVAILABLE:
-            self.weather_service = get_weather_service()
-        
-        # IP查询相关关键词
-        self.ip_keywords = {
-            "current_ip": [
-                "我的IP", "当前IP", "本机IP", "IP地址", "公网IP", "外网IP", "我的ip",
-                "查询IP", "查看IP", "获取IP", "显示IP", "IP是什么", "IP是多少",
-                "my ip", "current ip", "ip address", "public ip", "external ip",
-                "what is my ip", "show my ip", "get my ip", "check ip"
-            ],
-            "ip_location": [
-                "IP位置", "IP地理位置", "IP归属地", "IP所在地", "IP定位", "查询IP位置",
-                "ip location", "ip geolocation", "where is ip", "ip address location",
-                "locate ip", "find ip location", "ip info", "ip information"
-            ],
-            "ip_weather": [
-                "我这里的天气", "本地天气", "当前位置天气", "我所在地天气", "这里天气",
-                "local weather", "weather here", "my location weather", "current location weather"
-            ]
-        }
-        
-        # IP地址正则表达式
-        self.ip_patterns = [
-            r'\b(?:\d{1,3}\.){3}\d{1,3}\b',  # IPv4
-            r'\b(?:[0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4}\b',  # IPv6完整格式
-            r'\b[0-9a-fA-F:]+::[0-9a-fA-F:]*\b'  # IPv6压缩格式
-        ]
-        
-        logging.info("IP查询处理器初始化完成")
+        logger.info("IP查询处理器初始化完成")
+    
+    @property
+    def ip_service(self):
+        """IP地址查询服务（首次访问时获取）"""
+        if self._ip_service is None and IP_SERVICE_AVAILABLE:
+            self._ip_service = get_ip_location_service()
+        return self._ip_service
+    
+    @property
+    def weather_service(self):
+        """天气服务（首次访问时获取）"""
+        if self._weather_service is None and WEATHER_SERVICE_AVAILABLE:
+            self._weather_service = get_weather_service()
+        return self._weather_service
+    
+    @property
+    def _lookup_pool(self) -> ThreadPoolExecutor:
+        """IP查询线程池：同时向多个IP数据源发起查询，取最先成功的结果，降低长尾延迟"""
+        if self._lookup_pool_instance is None:
+            with self._lazy_init_lock:
+                if self._lookup_pool_instance is None:
+                    self._lookup_pool_instance = ThreadPoolExecutor(
+                        max_workers=len(self.ip_service.PROVIDERS),
+                        thread_name_prefix="ip-lookup"
+                    )
+        return self._lookup_pool_instance
     
     def is_ip_query(self, query: str) -> bool:
         """判断是否为IP查询"""
-        if not query:
-            return False
-        
-        query_lower = query.lower()
-        
-        # 检查是否包含IP相关关键词
-        all_keywords = []
-        for keywords in self.ip_keywords.values():
-            all_keywords.extend(keywords)
-        
-        return any(keyword in query_lower for keyword in all_keywords)
+        return _classify_query(query)[0]
     
     def parse_ip_query(self, query: str) -> Dict[str, Any]:
         """解析IP查询"""
-        if not self.is_ip_query(query):
-            return {
-                "is_ip_query": False,
-                "error": "不是IP查询"
-            }
-        
         try:
-            # 确定查询类型
-            query_type = self._determine_query_type(query)
-            
-            # 提取IP地址（如果有）
-            ip_address = self._extract_ip_address(query)
+            is_query, query_type, ip_address = _classify_query(query)
+            if not is_query:
+                return {
+                    "is_ip_query": False,
+                    "error": "不是IP查询"
+                }
             
             result = {
                 "is_ip_query": True,
@@ -102,11 +295,12 @@ class IPQueryHandler:
                 "original_query": query
             }
             
-            logging.info(f"IP查询解析结果: {result}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("IP查询解析结果: %s", result)
             return result
             
         except Exception as e:
-            logging.error(f"解析IP查询失败: {e}")
+            logger.error("解析IP查询失败: %s", e)
             return {
                 "is_ip_query": False,
                 "error": f"解析失败: {str(e)}"
@@ -115,36 +309,24 @@ class IPQueryHandler:
     def _determine_query_type(self, query: str) -> str:
         """确定查询类型"""
         query_lower = query.lower()
-        
-        # 检查IP天气查询关键词
-        for keyword in self.ip_keywords["ip_weather"]:
-            if keyword in query_lower:
-                return "ip_weather"
-        
-        # 检查IP位置查询关键词
-        for keyword in self.ip_keywords["ip_location"]:
-            if keyword in query_lower:
-                return "ip_location"
-        
-        # 检查当前IP查询关键词
-        for keyword in self.ip_keywords["current_ip"]:
-            if keyword in query_lower:
-                return "current_ip"
-        
-        # 如果包含IP地址，默认为IP位置查询
-        if self._extract_ip_address(query):
-            return "ip_location"
-        
-        # 默认为当前IP查询
-        return "current_ip"
+        return _pick_query_type(_matched_categories(query_lower), self._extract_ip_address(query_lower))
+    
+    def _extract_ip_addresses(self, query: str) -> List[str]:
+        """提取查询中的所有有效IP地址（规范化形式，按出现顺序，去重）"""
+        matches = []
+        if "." in query:
+            matches.extend(_IPV4_RE.finditer(query))
+        if ":" in query:
+            matches.extend(_IPV6_RE.finditer(query))
+            matches.sort(key=lambda match: match.start())
+        canonical = (_canon_ip(match.group(0)) for match in matches)
+        return list(dict.fromkeys(ip_address for ip_address in canonical if ip_address))
     
     def _extract_ip_address(self, query: str) -> Optional[str]:
         """提取IP地址"""
-        for pattern in self.ip_patterns:
-            match = re.search(pattern, query)
-            if match:
-                return match.group(0)
-        return None
+        # 绝大多数是IPv4，先匹配IPv4，未找到再匹配IPv6
+        match = _search_ip(query)
+        return match.group(0) if match else None
     
     def handle_ip_query(self, query: str) -> Dict[str, Any]:
         """处理IP查询"""
@@ -155,19 +337,15 @@ class IPQueryHandler:
                 "response": "❌ IP查询服务暂时不可用，请稍后再试。"
             }
         
-        # 解析查询
-        parse_result = self.parse_ip_query(query)
-        
-        if not parse_result.get("is_ip_query"):
-            return {
-                "success": False,
-                "error": "不是IP查询",
-                "response": "这不是一个IP查询问题。"
-            }
-        
         try:
-            query_type = parse_result["query_type"]
-            ip_address = parse_result["ip_address"]
+            # 直接使用分类结果，不构建parse_ip_query的结果字典
+            is_query, query_type, ip_address = _classify_query(query)
+            if not is_query:
+                return {
+                    "success": False,
+                    "error": "不是IP查询",
+                    "response": "这不是一个IP查询问题。"
+                }
             
             # 根据查询类型调用相应的服务
             if query_type == "current_ip":
@@ -190,17 +368,141 @@ class IPQueryHandler:
                 }
             
         except Exception as e:
-            logging.error(f"处理IP查询失败: {e}")
+            logger.error("处理IP查询失败: %s", e)
             return {
                 "success": False,
                 "error": str(e),
                 "response": f"❌ IP查询失败: {str(e)}"
             }
     
+    def handle_ip_query_batch(self, queries: List[str]) -> List[Dict[str, Any]]:
+        """批量处理IP查询：所有查询中出现的IP地址去重后合并为一次批量请求，结果按查询顺序返回"""
+        if not IP_SERVICE_AVAILABLE:
+            return [self.handle_ip_query(query) for query in queries]
+        
+        # 先找出所有指定了IP地址的位置查询
+        addresses_by_index = {}
+        for index, query in enumerate(queries):
+            is_query, query_type, _ = _classify_query(query)
+            if is_query and query_type == "ip_location":
+                ip_addresses = self._extract_ip_addresses(query)
+                if ip_addresses:
+                    addresses_by_index[index] = ip_addresses
+        
+        ip_infos = {}
+        if addresses_by_index:
+            ip_infos = self._lookup_ip_info_batch(
+                [ip_address for ip_addresses in addresses_by_index.values() for ip_address in ip_addresses]
+            )
+        
+        results = []
+        for index, query in enumerate(queries):
+            ip_addresses = addresses_by_index.get(index)
+            if not ip_addresses:
+                # 当前IP、本地天气等查询按单条处理
+                results.append(self.handle_ip_query(query))
+            elif len(ip_addresses) == 1:
+                results.append(self._build_ip_location_result(ip_addresses[0], ip_infos[ip_addresses[0]]))
+            else:
+                location_results = [
+                    self._build_ip_location_result(ip_address, ip_infos[ip_address])
+                    for ip_address in ip_addresses
+                ]
+                results.append({
+                    "success": any(result["success"] for result in location_results),
+                    "query_type": "ip_location",
+                    "ip_addresses": ip_addresses,
+                    "results": location_results,
+                    "response": "\n\n".join(result["response"] for result in location_results)
+                })
+        return results
+    
+    def _parallel_ip_lookup(self, ip_address: Optional[str] = None) -> Dict[str, Any]:
+        """并发查询所有IP数据源，返回最先成功的结果（全部失败时返回最后一个失败结果）"""
+        futures = [
+            self._lookup_pool.submit(self.ip_service.get_ip_info_from, provider, ip_address)
+            for provider in self.ip_service.PROVIDERS
+        ]
+        result = {"success": False, "error": "没有可用的IP数据源"}
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                if result.get("success"):
+                    return result
+        finally:
+            # 其余尚未开始的查询不再需要
+            for future in futures:
+                future.cancel()
+        
+        if ip_address:
+            # HTTP数据源全部失败时，用DNS查询至少给出ASN和国家
+            dns_result = self.ip_service.get_ip_info_from("team-cymru", ip_address)
+            if dns_result.get("success"):
+                return dns_result
+        return result
+    
+    def _get_cached_ip_info(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """查找未过期的缓存IP信息"""
+        with self._ip_cache_lock:
+            entry = self._ip_cache.get(key)
+            if entry is None:
+                return None
+            expires_at, ip_info = entry
+            if time.monotonic() >= expires_at:
+                del self._ip_cache[key]
+                return None
+            self._ip_cache.move_to_end(key)
+            return ip_info
+    
+    def _cache_ip_info(self, key: Optional[str], ip_info: Dict[str, Any]):
+        """缓存成功的IP信息"""
+        if not ip_info.get("success"):
+            return
+        ttl = self._current_ip_cache_ttl if key is None else self._ip_cache_ttl
+        with self._ip_cache_lock:
+            self._ip_cache[key] = (time.monotonic() + ttl, ip_info)
+            self._ip_cache.move_to_end(key)
+            while len(self._ip_cache) > self._ip_cache_size:
+                self._ip_cache.popitem(last=False)
+    
+    def _lookup_ip_info(self, ip_address: Optional[str] = None) -> Dict[str, Any]:
+        """获取IP信息（ip_address为规范化的IP地址，None时查询当前IP），成功的结果按TTL缓存"""
+        ip_info = self._get_cached_ip_info(ip_address)
+        if ip_info is None:
+            ip_info = self._parallel_ip_lookup(ip_address)
+            self._cache_ip_info(ip_address, ip_info)
+        return ip_info
+    
+    def _lookup_ip_info_batch(self, ip_addresses: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批量获取IP信息（规范化的IP地址）：先查缓存，未命中的地址合并为一次批量请求"""
+        results = {}
+        missing = []
+        for ip_address in dict.fromkeys(ip_addresses):
+            ip_info = self._get_cached_ip_info(ip_address)
+            if ip_info is None:
+                missing.append(ip_address)
+            else:
+                results[ip_address] = ip_info
+        
+        if missing:
+            fetched = self.ip_service.get_ip_info_batch(missing)
+            for ip_address in missing:
+                ip_info = fetched.get(ip_address) or {"success": False, "error": "未返回结果"}
+                self._cache_ip_info(ip_address, ip_info)
+                results[ip_address] = ip_info
+        return results
+    
+    def clear_ip_cache(self):
+        """清空IP信息缓存（包括IP查询服务的缓存）"""
+        with self._ip_cache_lock:
+            self._ip_cache.clear()
+        if self._ip_service is not None:
+            self._ip_service.clear_cache()
+    
     def _handle_current_ip_query(self) -> Dict[str, Any]:
         """处理当前IP查询"""
         try:
-            ip_info = self.ip_service.get_current_ip_info()
+            ip_info = self._lookup_ip_info()
             
             if ip_info["success"]:
                 response = self.ip_service.format_ip_info_response(ip_info)
@@ -218,7 +520,7 @@ class IPQueryHandler:
                 }
                 
         except Exception as e:
-            logging.error(f"处理当前IP查询失败: {e}")
+            logger.error("处理当前IP查询失败: %s", e)
             return {
                 "success": False,
                 "error": str(e),
@@ -227,33 +529,44 @@ class IPQueryHandler:
     
     def _handle_ip_location_query(self, ip_address: str) -> Dict[str, Any]:
         """处理IP位置查询"""
+        canonical_ip = _canon_ip(ip_address)
+        if canonical_ip is None:
+            # 正则匹配到的不是合法地址，不发起网络请求
+            return {
+                "success": False,
+                "error": "无效的IP地址格式",
+                "response": f"❌ {ip_address} 不是有效的IP地址。"
+            }
+        
         try:
-            ip_info = self.ip_service.get_ip_info(ip_address)
-            
-            if ip_info["success"]:
-                response = self.ip_service.format_ip_info_response(ip_info)
-                return {
-                    "success": True,
-                    "query_type": "ip_location",
-                    "ip_address": ip_address,
-                    "ip_data": ip_info,
-                    "response": response
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": ip_info.get("error", "未知错误"),
-                    "response": f"❌ 获取IP {ip_address} 信息失败: {ip_info.get('error', '未知错误')}"
-                }
+            return self._build_ip_location_result(canonical_ip, self._lookup_ip_info(canonical_ip))
                 
         except Exception as e:
-            logging.error(f"处理IP位置查询失败: {e}")
+            logger.error("处理IP位置查询失败: %s", e)
             return {
                 "success": False,
                 "error": str(e),
                 "response": f"❌ IP位置查询失败: {str(e)}"
             }
     
+    def _build_ip_location_result(self, ip_address: str, ip_info: Dict[str, Any]) -> Dict[str, Any]:
+        """根据IP信息构建位置查询结果"""
+        if ip_info["success"]:
+            response = self.ip_service.format_ip_info_response(ip_info)
+            return {
+                "success": True,
+                "query_type": "ip_location",
+                "ip_address": ip_address,
+                "ip_data": ip_info,
+                "response": response
+            }
+        else:
+            return {
+                "success": False,
+                "error": ip_info.get("error", "未知错误"),
+                "response": f"❌ 获取IP {ip_address} 信息失败: {ip_info.get('error', '未知错误')}"
+            }
+    
     def _handle_ip_weather_query(self) -> Dict[str, Any]:
         """处理基于IP的天气查询"""
         try:
@@ -307,7 +620,7 @@ class IPQueryHandler:
                 }
                 
         except Exception as e:
-            logging.error(f"处理IP天气查询失败: {e}")
+            logger.error("处理IP天气查询失败: %s", e)
             return {
                 "success": False,
                 "error": str(e),
@@ -335,8 +648,8 @@ def get_ip_query_handler() -> IPQueryHandler:
     return ip_query_handler
 
 def is_ip_query(query: str) -> bool:
-    """快速判断是否为IP查询"""
-    return ip_query_handler.is_ip_query(query)
+    """快速判断是否为IP查询（只用模块级的匹配器，不经过处理器实例）"""
+    return _classify_query(query)[0]
 
 def handle_ip_query(query: str) -> Dict[str, Any]:
     """快速处理IP查询"""
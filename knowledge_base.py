@@ -15,6 +15,7 @@ from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import sqlite3
 import threading
+from functools import lru_cache
 
 # 文档解析相关导入
 try:
@@ -37,13 +38,20 @@ except ImportError:
 
 # 向量化搜索相关导入
 try:
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.metrics.pairwise import cosine_similarity
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.preprocessing import normalize
     import numpy as np
+    import scipy.sparse as sp
     VECTOR_SEARCH_AVAILABLE = True
 except ImportError:
     VECTOR_SEARCH_AVAILABLE = False
 
+# FTS5 trigram分词按3个字符建索引，支持任意子串（包括中文）匹配，更短的查询词无法使用全文索引
+FTS_MIN_QUERY_LENGTH = 3
+
+# 哈希向量化的特征维数（无需拟合词表，新增文档时只对新文档做一次变换）
+HASHING_N_FEATURES = 2 ** 18
+
 class DocumentParser:
     """文档内容解析器"""
     
@@ -117,6 +125,19 @@ class DocumentParser:
         # DOC格式需要特殊处理，这里返回提示信息
         return "DOC格式文件需要转换为DOCX格式才能解析内容。"
     
+    def extract_metadata(self, file_path, content: str) -> Dict[str, Any]:
+        """提取文档元数据"""
+        file_path = Path(file_path)
+        stat = file_path.stat()
+        return {
+            "file_size": stat.st_size,
+            "modified_time": datetime.fromtimestamp(stat.st_mtime),
+            "word_count": len(content.split()),
+            "char_count": len(content),
+            "line_count": len(content.split('\n')),
+            "format": file_path.suffix.lower()
+        }
+    
     def parse_document(self, file_path: str) -> Dict[str, Any]:
         """解析文档并返回结构化信息"""
         try:
@@ -134,20 +155,10 @@ class DocumentParser:
             # 解析内容
             content = self.supported_formats[extension](str(file_path))
             
-            # 提取元数据
-            metadata = {
-                "file_size": file_path.stat().st_size,
-                "modified_time": datetime.fromtimestamp(file_path.stat().st_mtime),
-                "word_count": len(content.split()),
-                "char_count": len(content),
-                "line_count": len(content.split('\n')),
-                "format": extension
-            }
-            
             return {
                 "success": True,
                 "content": content,
-                "metadata": metadata,
+                "metadata": self.extract_metadata(file_path, content),
                 "error": None
             }
             
@@ -171,6 +182,25 @@ class KnowledgeBase:
         self.documents = []
         self.lock = threading.Lock()
         
+        # 向量索引：词频矩阵（每行一个文档，顺序与self.documents一致）和每个特征的文档频率，
+        # 增删文档时增量更新；TF-IDF加权并归一化后的document_vectors在搜索时按需计算
+        self._tf = None
+        self._df = None
+        self._idf = None
+        
+        # 全文索引（SQLite FTS5）是否可用，在init_database中检测
+        self.fts_available = False
+        if VECTOR_SEARCH_AVAILABLE:
+            self.vectorizer = HashingVectorizer(
+                n_features=HASHING_N_FEATURES,
+                ngram_range=(1, 2),
+                alternate_sign=False,
+                norm=None
+            )
+        
+        # 查询词频向量缓存（哈希向量化与文档无关，索引变化时无需清空）
+        self._transform_query_cached = lru_cache(maxsize=1024)(self._transform_query)
+        
         # 初始化数据库
         self.init_database()
         
@@ -197,10 +227,16 @@ class KnowledgeBase:
                         tags TEXT DEFAULT '',
                         category TEXT DEFAULT '',
                         created_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        updated_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        updated_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        content_hash BLOB
                     )
                 ''')
                 
+                # 旧数据库补充文件内容哈希列
+                cursor.execute('PRAGMA table_info(documents)')
+                if 'content_hash' not in {column[1] for column in cursor.fetchall()}:
+                    cursor.execute('ALTER TABLE documents ADD COLUMN content_hash BLOB')
+                
                 # 创建索引
                 cursor.execute('''
                     CREATE INDEX IF NOT EXISTS idx_file_id ON documents(file_id)
@@ -211,38 +247,121 @@ class KnowledgeBase:
                 cursor.execute('''
                     CREATE INDEX IF NOT EXISTS idx_category ON documents(category)
                 ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_content_hash ON documents(content_hash)
+                ''')
+                
+                # 词频向量缓存：按文件内容的SHA-256缓存词频向量（特征下标、计数）。
+                # 解析出的文本直接取自documents表中同哈希的文档，不再引用的缓存行随文档删除
+                cursor.execute('PRAGMA table_info(doc_cache)')
+                if 'content' in {column[1] for column in cursor.fetchall()}:
+                    # 旧版缓存表重复保存了文本，直接重建（只是缓存）
+                    cursor.execute('DROP TABLE doc_cache')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS doc_cache (
+                        hash BLOB PRIMARY KEY,
+                        tf_indices BLOB NOT NULL,
+                        tf_counts BLOB NOT NULL
+                    )
+                ''')
                 
                 conn.commit()
                 logging.info("知识库数据库初始化完成")
+            
+            self.fts_available = self.init_fulltext_index()
                 
         except Exception as e:
             logging.error(f"数据库初始化失败: {e}")
     
+    def init_fulltext_index(self) -> bool:
+        """创建FTS5全文索引（外部内容表，由触发器与documents表同步），返回是否可用"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'documents_fts'")
+                is_new = cursor.fetchone() is None
+                
+                # trigram分词需要SQLite 3.34+，不支持时回退到逐文档扫描
+                cursor.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                        content, file_name,
+                        content='documents', content_rowid='id',
+                        tokenize='trigram'
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS documents_fts_insert AFTER INSERT ON documents BEGIN
+                        INSERT INTO documents_fts(rowid, content, file_name)
+                        VALUES (new.id, new.content, new.file_name);
+                    END
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS documents_fts_delete AFTER DELETE ON documents BEGIN
+                        INSERT INTO documents_fts(documents_fts, rowid, content, file_name)
+                        VALUES ('delete', old.id, old.content, old.file_name);
+                    END
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS documents_fts_update AFTER UPDATE OF content, file_name ON documents BEGIN
+                        INSERT INTO documents_fts(documents_fts, rowid, content, file_name)
+                        VALUES ('delete', old.id, old.content, old.file_name);
+                        INSERT INTO documents_fts(rowid, content, file_name)
+                        VALUES (new.id, new.content, new.file_name);
+                    END
+                ''')
+                
+                if is_new:
+                    # 为已有文档建立索引
+                    cursor.execute("INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')")
+                
+                conn.commit()
+                return True
+                
+        except sqlite3.Error as e:
+            logging.warning(f"全文索引不可用，关键词搜索将逐文档扫描: {e}")
+            return False
+    
     def add_document(self, file_id: str, file_name: str, file_path: str, 
                     tags: List[str] = None, category: str = "") -> Dict[str, Any]:
         """添加文档到知识库"""
         try:
             with self.lock:
-                # 解析文档内容
-                parse_result = self.parser.parse_document(file_path)
-                
-                if not parse_result["success"]:
-                    return {
-                        "success": False,
-                        "error": f"文档解析失败: {parse_result['error']}"
-                    }
+                # 内容相同的文件直接复用缓存的解析结果和词频向量，跳过解析和向量化
+                with open(file_path, 'rb') as f:
+                    content_hash = self._content_hash(f.read())
+                cached = self._load_doc_cache(content_hash)
                 
-                content = parse_result["content"]
-                metadata = parse_result["metadata"]
+                if cached is not None:
+                    content, tf_row = cached
+                    metadata = self.parser.extract_metadata(file_path, content)
+                else:
+                    # 解析文档内容
+                    parse_result = self.parser.parse_document(file_path)
+                    
+                    if not parse_result["success"]:
+                        return {
+                            "success": False,
+                            "error": f"文档解析失败: {parse_result['error']}"
+                        }
+                    
+                    content = parse_result["content"]
+                    metadata = parse_result["metadata"]
+                    tf_row = self.vectorizer.transform([content]) if VECTOR_SEARCH_AVAILABLE else None
                 
                 # 存储到数据库
                 with sqlite3.connect(self.db_path) as conn:
                     cursor = conn.cursor()
                     
+                    cursor.execute('SELECT content_hash FROM documents WHERE file_id = ?', (file_id,))
+                    old_row = cursor.fetchone()
+                    
+                    # 先显式删除同file_id的旧文档：REPLACE删除旧行时不会触发DELETE触发器，全文索引会残留旧内容
+                    cursor.execute('DELETE FROM documents WHERE file_id = ?', (file_id,))
                     cursor.execute('''
-                        INSERT OR REPLACE INTO documents 
-                        (file_id, file_name, file_path, content, metadata, tags, category, updated_time)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                        INSERT INTO documents 
+                        (file_id, file_name, file_path, content, metadata, tags, category, updated_time, content_hash)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?)
                     ''', (
                         file_id,
                         file_name,
@@ -250,13 +369,22 @@ class KnowledgeBase:
                         content,
                         json.dumps(metadata, default=str),
                         ','.join(tags) if tags else '',
-                        category
+                        category,
+                        content_hash
                     ))
                     
+                    if cached is None and tf_row is not None:
+                        self._store_doc_cache(cursor, content_hash, tf_row)
+                    if old_row is not None and old_row[0] != content_hash:
+                        self._prune_doc_cache(cursor, old_row[0])
+                    
                     conn.commit()
+                    
+                    cursor.execute('SELECT * FROM documents WHERE file_id = ?', (file_id,))
+                    doc = self._row_to_document(cursor.fetchone())
                 
-                # 重新构建向量索引
-                self.rebuild_vector_index()
+                # 增量更新内存中的文档列表和向量索引
+                self._index_add_document(doc, tf_row)
                 
                 logging.info(f"文档已添加到知识库: {file_name}")
                 
@@ -274,6 +402,62 @@ class KnowledgeBase:
                 "error": str(e)
             }
     
+    @staticmethod
+    def _content_hash(data: bytes) -> bytes:
+        """文件内容哈希（解析结果缓存的键）"""
+        return hashlib.sha256(data).digest()
+    
+    def _load_doc_cache(self, content_hash: bytes) -> Optional[Tuple[str, Any]]:
+        """查找同内容文档的解析结果，返回 (文本, 词频向量或None)，未命中返回None"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT d.content, c.tf_indices, c.tf_counts
+                FROM documents d LEFT JOIN doc_cache c ON c.hash = d.content_hash
+                WHERE d.content_hash = ? LIMIT 1
+            ''', (content_hash,))
+            row = cursor.fetchone()
+        
+        if row is None:
+            return None
+        
+        content, tf_indices, tf_counts = row
+        tf_row = None
+        if VECTOR_SEARCH_AVAILABLE:
+            if tf_indices is None:
+                tf_row = self.vectorizer.transform([content])
+            else:
+                indices = np.frombuffer(tf_indices, dtype=np.int32)
+                counts = np.frombuffer(tf_counts, dtype=np.float64)
+                tf_row = sp.csr_matrix(
+                    (counts, indices, np.array([0, len(indices)])),
+                    shape=(1, HASHING_N_FEATURES)
+                )
+        return content, tf_row
+    
+    @staticmethod
+    def _store_doc_cache(cursor, content_hash: bytes, tf_row):
+        """缓存词频向量（与文档写入在同一事务中）"""
+        cursor.execute(
+            'INSERT OR REPLACE INTO doc_cache (hash, tf_indices, tf_counts) VALUES (?, ?, ?)',
+            (
+                content_hash,
+                tf_row.indices.astype(np.int32).tobytes(),
+                tf_row.data.astype(np.float64).tobytes()
+            )
+        )
+    
+    @staticmethod
+    def _prune_doc_cache(cursor, content_hash: Optional[bytes]):
+        """删除已没有文档引用的词频向量缓存"""
+        if content_hash is None:
+            return
+        cursor.execute(
+            'DELETE FROM doc_cache WHERE hash = ? AND NOT EXISTS '
+            '(SELECT 1 FROM documents WHERE content_hash = ?)',
+            (content_hash, content_hash)
+        )
+    
     def remove_document(self, file_id: str) -> Dict[str, Any]:
         """从知识库移除文档"""
         try:
@@ -281,11 +465,14 @@ class KnowledgeBase:
                 with sqlite3.connect(self.db_path) as conn:
                     cursor = conn.cursor()
                     
+                    cursor.execute('SELECT content_hash FROM documents WHERE file_id = ?', (file_id,))
+                    old_row = cursor.fetchone()
                     cursor.execute('DELETE FROM documents WHERE file_id = ?', (file_id,))
                     
                     if cursor.rowcount > 0:
+                        self._prune_doc_cache(cursor, old_row[0])
                         conn.commit()
-                        self.rebuild_vector_index()
+                        self._index_remove_document(file_id)
                         logging.info(f"文档已从知识库移除: {file_id}")
                         return {"success": True, "message": "文档已从知识库移除"}
                     else:
@@ -300,23 +487,10 @@ class KnowledgeBase:
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
-                cursor.execute('SELECT * FROM documents ORDER BY created_time DESC')
+                # id作为次要排序键，保证重新加载后顺序不变（与向量索引的行一一对应）
+                cursor.execute('SELECT * FROM documents ORDER BY created_time DESC, id DESC')
                 
-                self.documents = []
-                for row in cursor.fetchall():
-                    doc = {
-                        "id": row[0],
-                        "file_id": row[1],
-                        "file_name": row[2],
-                        "file_path": row[3],
-                        "content": row[4],
-                        "metadata": json.loads(row[5]),
-                        "tags": row[6].split(',') if row[6] else [],
-                        "category": row[7],
-                        "created_time": row[8],
-                        "updated_time": row[9]
-                    }
-                    self.documents.append(doc)
+                self.documents = [self._row_to_document(row) for row in cursor.fetchall()]
                 
                 logging.info(f"已加载 {len(self.documents)} 个文档")
                 
@@ -324,6 +498,72 @@ class KnowledgeBase:
             logging.error(f"加载文档失败: {e}")
             self.documents = []
     
+    @staticmethod
+    def _row_to_document(row) -> Dict[str, Any]:
+        """把documents表的一行转换为文档字典"""
+        return {
+            "id": row[0],
+            "file_id": row[1],
+            "file_name": row[2],
+            "file_path": row[3],
+            "content": row[4],
+            "metadata": json.loads(row[5]),
+            "tags": row[6].split(',') if row[6] else [],
+            "category": row[7],
+            "created_time": row[8],
+            "updated_time": row[9]
+        }
+    
+    def _vector_index_in_sync(self) -> bool:
+        """向量索引的行是否与self.documents一一对应"""
+        return self._tf is not None and self._tf.shape[0] == len(self.documents)
+    
+    def _index_add_document(self, doc: Dict[str, Any], tf_row=None):
+        """把新文档加入内存文档列表（最新的在最前）并增量更新向量索引（tf_row为已算好的词频向量）"""
+        # 同file_id的新文档替换旧文档
+        self._index_remove_document(doc["file_id"])
+        
+        in_sync = self._vector_index_in_sync()
+        self.documents.insert(0, doc)
+        if not VECTOR_SEARCH_AVAILABLE:
+            return
+        if not in_sync:
+            # 索引还未建立，一次性构建
+            self.rebuild_vector_index()
+            return
+        
+        row = tf_row if tf_row is not None else self.vectorizer.transform([doc["content"]])
+        self._tf = sp.vstack([row, self._tf], format="csr")
+        self._df[row.indices] += 1
+        self.document_vectors = None
+    
+    def _index_remove_document(self, file_id: str):
+        """从内存文档列表移除文档，并从向量索引中删除对应的行"""
+        index = next((i for i, doc in enumerate(self.documents) if doc["file_id"] == file_id), None)
+        if index is None:
+            return
+        
+        in_sync = self._vector_index_in_sync()
+        del self.documents[index]
+        if not in_sync:
+            return
+        
+        self._df[self._tf[index].indices] -= 1
+        keep = np.ones(self._tf.shape[0], dtype=bool)
+        keep[index] = False
+        self._tf = self._tf[keep]
+        self.document_vectors = None
+    
+    def _get_document_vectors(self):
+        """返回TF-IDF加权并L2归一化的文档向量，索引变化后第一次搜索时计算"""
+        if self.document_vectors is None and self._vector_index_in_sync() and self._tf.shape[0]:
+            # 与TfidfVectorizer(smooth_idf=True)相同的IDF公式；没有文档出现过的特征权重为0，
+            # 相当于TfidfVectorizer忽略词表外的查询词
+            idf = np.log((self._tf.shape[0] + 1) / (self._df + 1)) + 1
+            self._idf = np.where(self._df > 0, idf, 0.0)
+            self.document_vectors = normalize(self._tf.multiply(self._idf).tocsr())
+        return self.document_vectors
+    
     def rebuild_vector_index(self):
         """重建向量索引"""
         if not VECTOR_SEARCH_AVAILABLE:
@@ -335,19 +575,17 @@ class KnowledgeBase:
                 self.load_documents()
             
             if not self.documents:
+                self._tf = None
+                self.document_vectors = None
                 return
             
             # 提取文档内容
             texts = [doc["content"] for doc in self.documents]
             
-            # 构建TF-IDF向量
-            self.vectorizer = TfidfVectorizer(
-                max_features=1000,
-                stop_words=None,  # 保留中文支持
-                ngram_range=(1, 2)
-            )
-            
-            self.document_vectors = self.vectorizer.fit_transform(texts)
+            # 构建词频矩阵和文档频率（哈希向量化无需拟合，每行只依赖对应文档）
+            self._tf = self.vectorizer.transform(texts).tocsr()
+            self._df = np.bincount(self._tf.indices, minlength=HASHING_N_FEATURES)
+            self.document_vectors = None
             
             logging.info(f"向量索引构建完成，包含 {len(texts)} 个文档")
             
@@ -364,7 +602,7 @@ class KnowledgeBase:
             results.extend(keyword_results)
 
             # 2. 向量搜索（如果可用）
-            if VECTOR_SEARCH_AVAILABLE and self.vectorizer and self.document_vectors is not None:
+            if VECTOR_SEARCH_AVAILABLE and self._vector_index_in_sync():
                 vector_results = self.vector_search(query, limit)
                 results.extend(vector_results)
 
@@ -387,6 +625,52 @@ class KnowledgeBase:
 
     def keyword_search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
         """关键词搜索"""
+        if self.fts_available and len(query.strip()) >= FTS_MIN_QUERY_LENGTH:
+            return self._keyword_search_fts(query.strip(), limit)
+        return self._keyword_search_scan(query, limit)
+
+    def _keyword_search_fts(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """通过FTS5全文索引搜索，按BM25排序（标题权重更高）"""
+        try:
+            # 整个查询作为一个短语做子串匹配，与逐文档扫描的语义一致
+            phrase = '"' + query.replace('"', '""') + '"'
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT d.*, bm25(documents_fts, 1.0, 3.0) AS score
+                    FROM documents_fts
+                    JOIN documents d ON d.id = documents_fts.rowid
+                    WHERE documents_fts MATCH ?
+                    ORDER BY score
+                    LIMIT ?
+                ''', (phrase, limit))
+                rows = cursor.fetchall()
+
+            results = []
+            for row in rows:
+                doc = self._row_to_document(row)
+                results.append({
+                    "file_id": doc["file_id"],
+                    "file_name": doc["file_name"],
+                    "content": doc["content"],
+                    "snippets": self.extract_snippets(doc["content"], query, max_snippets=3),
+                    # bm25()越小越相关（不大于0）；加1使命中的文档分数与逐文档扫描一样至少为1，
+                    # 与向量搜索结果合并排序时排在前面
+                    "relevance_score": 1.0 - row[-1],
+                    "metadata": doc["metadata"],
+                    "tags": doc["tags"],
+                    "category": doc["category"],
+                    "search_type": "keyword"
+                })
+
+            return results
+
+        except Exception as e:
+            logging.error(f"全文索引搜索失败: {e}")
+            return []
+
+    def _keyword_search_scan(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        """逐文档扫描的关键词搜索（全文索引不可用或查询词过短时使用）"""
         try:
             query_lower = query.lower()
             results = []
@@ -424,17 +708,22 @@ class KnowledgeBase:
     def vector_search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
         """向量搜索"""
         try:
-            if not self.vectorizer or self.document_vectors is None:
+            document_vectors = self._get_document_vectors()
+            if document_vectors is None:
                 return []
 
-            # 将查询转换为向量
-            query_vector = self.vectorizer.transform([query])
+            # 将查询转换为TF-IDF向量
+            query_vector = normalize(self._transform_query_cached(query).multiply(self._idf).tocsr())
 
-            # 计算相似度
-            similarities = cosine_similarity(query_vector, self.document_vectors).flatten()
+            # 文档向量和查询向量都已L2归一化，余弦相似度即一次稀疏矩阵乘法
+            similarities = (document_vectors @ query_vector.T).toarray().ravel()
 
-            # 获取最相似的文档
-            top_indices = similarities.argsort()[-limit:][::-1]
+            # 获取最相似的文档：argpartition只选出前k个（O(N)），再对这k个排序
+            k = min(limit, similarities.size)
+            if k <= 0:
+                return []
+            top_indices = np.argpartition(-similarities, k - 1)[:k]
+            top_indices = top_indices[np.argsort(-similarities[top_indices])]
 
             results = []
             for idx in top_indices:
@@ -460,18 +749,29 @@ class KnowledgeBase:
             logging.error(f"向量搜索失败: {e}")
             return []
 
+    def _transform_query(self, query: str):
+        """将查询转换为词频向量"""
+        return self.vectorizer.transform([query])
+
     def extract_snippets(self, content: str, query: str, max_snippets: int = 3,
                         snippet_length: int = 200) -> List[str]:
         """提取相关文本片段"""
+        if not query:
+            return []
+
         try:
+            # 查询词不含大小写字母（如中文、数字）时直接在原文上查找，不必复制整篇文档做小写转换
             query_lower = query.lower()
-            content_lower = content.lower()
+            has_case = query_lower != query.upper()
+            content_lower = content.lower() if has_case else content
+            pattern = re.compile(re.escape(query), re.IGNORECASE)
+            highlighted = f"**{query}**"
             snippets = []
 
-            # 找到所有匹配位置
+            # 找到前max_snippets个匹配位置即停止扫描
             positions = []
             start = 0
-            while True:
+            while len(positions) < max_snippets:
                 pos = content_lower.find(query_lower, start)
                 if pos == -1:
                     break
@@ -479,19 +779,14 @@ class KnowledgeBase:
                 start = pos + 1
 
             # 为每个匹配位置提取片段
-            for pos in positions[:max_snippets]:
+            for pos in positions:
                 start = max(0, pos - snippet_length // 2)
                 end = min(len(content), pos + len(query) + snippet_length // 2)
 
                 snippet = content[start:end].strip()
 
                 # 高亮查询词
-                snippet = re.sub(
-                    re.escape(query),
-                    f"**{query}**",
-                    snippet,
-                    flags=re.IGNORECASE
-                )
+                snippet = pattern.sub(lambda _: highlighted, snippet)
 
                 if snippet not in snippets:
                     snippets.append(snippet)
@@ -534,7 +829,7 @@ class KnowledgeBase:
                 "total_characters": total_chars,
                 "categories": categories,
                 "formats": formats,
-                "vector_index_available": VECTOR_SEARCH_AVAILABLE and self.vectorizer is not None
+                "vector_index_available": VECTOR_SEARCH_AVAILABLE and self._vector_index_in_sync()
             }
 
         except Exception as e:
@@ -17,6 +17,25 @@ from datetime import datetime
 from typing import Dict, List, Optional, Any, AsyncGenerator
 from model_manager import ModelConfig, get_model_manager
 
+# orjson加速（可选）
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def _json_dumps(data: Any) -> bytes:
+    """序列化请求体"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+def _json_loads(content: bytes) -> Any:
+    """解析响应体"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(content)
+    return json.loads(content)
+
 class UniversalAPIClient:
     """通用API客户端"""
     
@@ -68,6 +87,27 @@ class UniversalAPIClient:
             logging.error(f"API调用失败: {e}")
             return {"success": False, "error": f"API调用失败: {e}"}
     
+    async def list_model_ids(self, model: ModelConfig) -> Optional[List[str]]:
+        """获取模型所属提供商的可用模型列表（提供商没有模型列表接口时返回None）"""
+        provider_info = self.model_manager.providers.get(model.provider)
+        if not provider_info:
+            return None
+        endpoint = provider_info.get("endpoints", {}).get("models")
+        if not endpoint:
+            return None
+        
+        headers = {
+            f"{provider_info['auth_header']}": f"{provider_info['auth_prefix']}{model.api_key}".strip()
+        }
+        if "additional_headers" in provider_info:
+            headers.update(provider_info["additional_headers"])
+        
+        async with httpx.AsyncClient(timeout=model.timeout) as client:
+            response = await client.get(f"{model.api_base_url}{endpoint}", headers=headers)
+            response.raise_for_status()
+            result = _json_loads(response.content)
+        return [item["id"] for item in result.get("data", [])]
+    
     async def _call_openai_api(self, model: ModelConfig, messages: List[Dict[str, str]], 
                               stream: bool = False, **kwargs) -> Dict[str, Any]:
         """调用OpenAI兼容的API"""
@@ -104,10 +144,10 @@ class UniversalAPIClient:
             
             # 发送请求
             async with httpx.AsyncClient(timeout=model.timeout) as client:
-                response = await client.post(url, headers=headers, json=data)
+                response = await client.post(url, headers=headers, content=_json_dumps(data))
                 
                 if response.status_code == 200:
-                    result = response.json()
+                    result = _json_loads(response.content)
                     
                     # 提取回复内容
                     if "choices" in result and result["choices"]:
@@ -175,10 +215,10 @@ class UniversalAPIClient:
             
             # 发送请求
             async with httpx.AsyncClient(timeout=model.timeout) as client:
-                response = await client.post(url, headers=headers, json=data)
+                response = await client.post(url, headers=headers, content=_json_dumps(data))
                 
                 if response.status_code == 200:
-                    result = response.json()
+                    result = _json_loads(response.content)
                     
                     # 提取回复内容
                     if "content" in result and result["content"]:
@@ -244,10 +284,10 @@ class UniversalAPIClient:
             
             # 发送请求
             async with httpx.AsyncClient(timeout=model.timeout) as client:
-                response = await client.post(url, headers=headers, json=data)
+                response = await client.post(url, headers=headers, content=_json_dumps(data))
                 
                 if response.status_code == 200:
-                    result = response.json()
+                    result = _json_loads(response.content)
                     
                     # 提取回复内容
                     if "candidates" in result and result["candidates"]:
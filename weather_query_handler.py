@@ -8,9 +8,17 @@
 import re
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, Tuple, List
+from functools import lru_cache
+from typing import Dict, Any, Optional, Tuple, List, Callable
 import jieba
 
+# Aho-Corasick多关键词匹配（可选）
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
 # 天气服务导入
 try:
     from weather_service import get_weather_service
@@ -19,6 +27,53 @@ except ImportError:
     WEATHER_SERVICE_AVAILABLE = False
     logging.warning("天气服务不可用")
 
+# 天气相关关键词
+WEATHER_KEYWORDS = {
+    "current": (
+        "天气", "气温", "温度", "现在", "当前", "今天", "今日",
+        "weather", "temperature", "current", "today", "now"
+    ),
+    "forecast": (
+        "预报", "预测", "明天", "后天", "未来", "几天", "一周",
+        "forecast", "prediction", "tomorrow", "future", "week"
+    ),
+    "historical": (
+        "历史", "过去", "昨天", "前天", "之前", "那天",
+        "historical", "past", "yesterday", "before", "history"
+    )
+}
+
+# 小写关键词（去重），导入时计算一次
+_ALL_KEYWORDS_LOWER = frozenset(
+    keyword.lower() for keywords in WEATHER_KEYWORDS.values() for keyword in keywords
+)
+
+
+def _build_keyword_matcher() -> Callable[[str], bool]:
+    """构建关键词匹配器，返回 小写文本 -> 是否包含任一关键词 的函数"""
+    if AHOCORASICK_AVAILABLE:
+        automaton = ahocorasick.Automaton()
+        for keyword in _ALL_KEYWORDS_LOWER:
+            automaton.add_word(keyword, keyword)
+        automaton.make_automaton()
+        
+        def contains_keyword(text: str) -> bool:
+            return next(automaton.iter(text), None) is not None
+        
+        return contains_keyword
+    
+    # 未安装pyahocorasick时退化为一个预编译的多选正则
+    pattern = re.compile("|".join(re.escape(keyword) for keyword in sorted(_ALL_KEYWORDS_LOWER)))
+    
+    def contains_keyword(text: str) -> bool:
+        return pattern.search(text) is not None
+    
+    return contains_keyword
+
+
+# 关键词匹配器：第一次判断时构建，之后共享
+_keyword_matcher = lru_cache(maxsize=None)(_build_keyword_matcher)
+
 class WeatherQueryHandler:
     """天气查询处理器"""
     
@@ -27,21 +82,8 @@ class WeatherQueryHandler:
         if WEATHER_SERVICE_AVAILABLE:
             self.weather_service = get_weather_service()
         
-        # 天气相关关键词
-        self.weather_keywords = {
-            "current": [
-                "天气", "气温", "温度", "现在", "当前", "今天", "今日",
-                "weather", "temperature", "current", "today", "now"
-            ],
-            "forecast": [
-                "预报", "预测", "明天", "后天", "未来", "几天", "一周",
-                "forecast", "prediction", "tomorrow", "future", "week"
-            ],
-            "historical": [
-                "历史", "过去", "昨天", "前天", "之前", "那天",
-                "historical", "past", "yesterday", "before", "history"
-            ]
-        }
+        # 天气相关关键词（模块级常量，实例间共享）
+        self.weather_keywords = WEATHER_KEYWORDS
         
         # 地点识别模式
         self.location_patterns = [
@@ -131,14 +173,8 @@ class WeatherQueryHandler:
         if not query:
             return False
         
-        query_lower = query.lower()
-        
-        # 检查是否包含天气相关关键词
-        all_keywords = []
-        for keywords in self.weather_keywords.values():
-            all_keywords.extend(keywords)
-        
-        return any(keyword in query_lower for keyword in all_keywords)
+        # 一次扫描检查是否包含天气相关关键词
+        return _keyword_matcher()(query.lower())
     
     def parse_weather_query(self, query: str) -> Dict[str, Any]:
         """解析天气查询"""
@@ -6,6 +6,7 @@
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import logging
 from datetime import datetime, timedelta
@@ -32,6 +33,12 @@ class WeatherService:
         # 请求超时设置
         self.timeout = 10
         
+        # 复用keep-alive连接，避免每次查询重新进行TCP和TLS握手
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        
         logging.info("天气查询服务初始化完成")
     
     def get_current_weather(self, location: str) -> Dict[str, Any]:
@@ -44,7 +51,7 @@ class WeatherService:
                 "units": "m"  # 使用公制单位
             }
             
-            response = requests.get(url, params=params, timeout=self.timeout)
+            response = self._session.get(url, params=params, timeout=self.timeout)
             response.raise_for_status()
             
             data = response.json()
@@ -115,7 +122,7 @@ class WeatherService:
                 "units": "m"
             }
             
-            response = requests.get(url, params=params, timeout=self.timeout)
+            response = self._session.get(url, params=params, timeout=self.timeout)
             response.raise_for_status()
             
             data = response.json()
@@ -168,7 +175,7 @@ class WeatherService:
                 "appid": self.openweather_api_key
             }
             
-            response = requests.get(url, params=params, timeout=self.timeout)
+            response = self._session.get(url, params=params, timeout=self.timeout)
             response.raise_for_status()
             
             data = response.json()
@@ -228,7 +235,7 @@ class WeatherService:
                 "lang": "zh_cn"
             }
 
-            current_response = requests.get(current_url, params=current_params, timeout=self.timeout)
+            current_response = self._session.get(current_url, params=current_params, timeout=self.timeout)
             current_response.raise_for_status()
             current_data = current_response.json()
 
@@ -242,7 +249,7 @@ class WeatherService:
                 "lang": "zh_cn"
             }
 
-            forecast_response = requests.get(forecast_url, params=forecast_params, timeout=self.timeout)
+            forecast_response = self._session.get(forecast_url, params=forecast_params, timeout=self.timeout)
             forecast_response.raise_for_status()
             forecast_data = forecast_response.json()
 
@@ -360,7 +367,7 @@ class WeatherService:
                 "lang": "zh_cn"     # 中文描述
             }
 
-            response = requests.get(url, params=params, timeout=self.timeout)
+            response = self._session.get(url, params=params, timeout=self.timeout)
             response.raise_for_status()
 
             data = response.json()